@@ -1,18 +1,28 @@
 import os
 import time
-import json
+import asyncio
+import aiohttp
 import pandas as pd
-import requests
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+
+import fastjson
+from cache import AbiCache
+
+# Arrow's multithreaded CSV reader with Arrow-backed columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_KW = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+except ImportError:
+    READ_CSV_KW = {}
 
 # ------------------------
 # Settings
 # ------------------------
 INPUT_FILE = "results/dust_enriched_results_targeted.csv"
 OUTPUT_FILE = "results/abi_signatures_targeted.csv"
-CACHE_FILE = "results/abi_cache.json"   # avoids refetching
+CACHE_FILE = "results/abi_cache.sqlite" # avoids refetching
 RATE_LIMIT_PER_SEC = 4                  # Etherscan allows ~5/s; stay under
 RETRY_COUNT = 3
 RETRY_DELAY = 1.5
@@ -30,47 +40,84 @@ ETHERSCAN_API = "https://api.etherscan.io/api"
 # ------------------------
 # Helpers
 # ------------------------
-def load_cache(path: Path) -> Dict[str, Any]:
-    if path.exists():
+class RateLimiter:
+    """Async limiter spacing request starts so at most `rate` begin per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+    async def __aexit__(self, *exc):
+        return False
+
+def parse_abi_result(data: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+    """Return (parsed ABI list, raw JSON text) from an Etherscan getabi payload, or (None, None)."""
+    if data.get("status") == "1" and data.get("result"):
         try:
-            return json.loads(path.read_text())
+            return fastjson.loads(data["result"]), data["result"]
         except Exception:
-            return {}
-    return {}
-
-def save_cache(path: Path, data: Dict[str, Any]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(".json.tmp")
-    tmp.write_text(json.dumps(data))
-    tmp.replace(path)
-
-def fetch_abi(address: str, session: requests.Session) -> Any:
-    """Return parsed ABI (list) or None."""
+            # Sometimes result is already a list
+            if isinstance(data["result"], list):
+                return data["result"], None
+    # Non-verified contracts or errors return status "0"
+    return None, None
+
+async def fetch_abi_async(session: aiohttp.ClientSession, address: str, limiter: RateLimiter) -> Tuple[Any, Optional[str]]:
+    """Return (parsed ABI list, raw JSON text) or (None, None)."""
     params = {
         "module": "contract",
         "action": "getabi",
         "address": address,
         "apikey": ETHERSCAN_API_KEY,
     }
+    timeout = aiohttp.ClientTimeout(total=15)
     for attempt in range(1, RETRY_COUNT + 1):
+        retry_after = None
         try:
-            r = session.get(ETHERSCAN_API, params=params, timeout=15)
-            r.raise_for_status()
-            data = r.json()
-            if data.get("status") == "1" and data.get("result"):
-                try:
-                    return json.loads(data["result"])
-                except Exception:
-                    # Sometimes result is already a list
-                    if isinstance(data["result"], list):
-                        return data["result"]
-            # Non-verified contracts or errors return status "0"
-            return None
-        except requests.RequestException:
+            async with limiter:
+                async with session.get(ETHERSCAN_API, params=params, timeout=timeout) as r:
+                    retry_after = r.headers.get("Retry-After") if r.status == 429 else None
+                    r.raise_for_status()
+                    data = fastjson.loads(await r.read())
+            return parse_abi_result(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
             if attempt == RETRY_COUNT:
-                return None
-            time.sleep(RETRY_DELAY)
-    return None
+                return None, None
+            # Honor the server's Retry-After on 429, otherwise back off linearly
+            try:
+                delay = float(retry_after) if retry_after else RETRY_DELAY * attempt
+            except ValueError:
+                delay = RETRY_DELAY * attempt
+            await asyncio.sleep(delay)
+    return None, None
+
+async def gather_all(addrs: List[str], cache: AbiCache) -> None:
+    """Fetch ABIs for `addrs` concurrently (bounded by RATE_LIMIT_PER_SEC) into `cache`."""
+    limiter = RateLimiter(RATE_LIMIT_PER_SEC)
+    sem = asyncio.Semaphore(RATE_LIMIT_PER_SEC)
+    connector = aiohttp.TCPConnector(limit=RATE_LIMIT_PER_SEC)
+    done = 0
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def fetch_one(addr_lc: str) -> None:
+            nonlocal done
+            async with sem:
+                abi, raw = await fetch_abi_async(session, addr_lc, limiter)
+            cache.set(addr_lc, abi, raw)  # store even if None to avoid refetching
+            done += 1
+            if done % 25 == 0:
+                print(f"  ↳ Fetched {done}/{len(addrs)}")
+
+        await asyncio.gather(*(fetch_one(a) for a in addrs))
 
 def extract_functions(abi: Any) -> List[str]:
     names = []
@@ -87,58 +134,51 @@ def extract_functions(abi: Any) -> List[str]:
 # ------------------------
 def main():
     print(f"🔍 Reading: {INPUT_FILE}")
-    df = pd.read_csv(INPUT_FILE)
+    df = pd.read_csv(INPUT_FILE, **READ_CSV_KW)
     if "Address" not in df.columns:
         raise SystemExit("❌ 'Address' column missing in enriched CSV.")
     # Normalize address casing
     df["Address"] = df["Address"].astype(str).str.strip()
 
     # Load ABI cache
-    cache_path = Path(CACHE_FILE)
-    cache = load_cache(cache_path)
+    cache = AbiCache(Path(CACHE_FILE))
+
+    # Keep some metadata columns if present, joined per address as rows are built
+    keep_cols = [c for c in ["Type", "Block", "extra_info", "Balance (ETH)"] if c in df.columns]
+    meta = df.drop_duplicates("Address").set_index("Address")[keep_cols].to_dict("index")
 
-    session = requests.Session()
     out_rows = []
     unique_addrs = sorted(set(df["Address"].tolist()))
     print(f"🧩 Unique contracts to query: {len(unique_addrs)}")
 
-    last_ts = 0.0
-    for i, addr in enumerate(unique_addrs, 1):
-        addr_lc = addr.lower()
+    # Fetch everything not cached concurrently; cache hits stay synchronous
+    uncached = sorted({a.lower() for a in unique_addrs if a.lower() not in cache})
+    known_unverified = sum(1 for a in unique_addrs if a.lower() in cache.unverified)
+    if known_unverified:
+        print(f"🚫 Known unverified contracts (skipped): {known_unverified}")
+    if uncached:
+        print(f"🌐 Fetching {len(uncached)} uncached ABIs from Etherscan")
+        asyncio.run(gather_all(uncached, cache))
 
-        if addr_lc in cache:
-            abi = cache[addr_lc]
-        else:
-            # Rate limit
-            elapsed = time.time() - last_ts
-            if elapsed < (1.0 / RATE_LIMIT_PER_SEC):
-                time.sleep((1.0 / RATE_LIMIT_PER_SEC) - elapsed)
-            abi = fetch_abi(addr_lc, session)
-            cache[addr_lc] = abi  # store even if None to avoid retries in same run
-            last_ts = time.time()
-            if i % 25 == 0:
-                save_cache(cache_path, cache)
+    for i, addr in enumerate(unique_addrs, 1):
+        abi = cache.parsed(addr)
+        addr_meta = meta.get(addr, {})
 
         funcs = extract_functions(abi) if abi else []
         if not funcs:
             # Ensure at least one row so downstream sees the address
-            out_rows.append({"Address": addr, "Function": ""})
+            out_rows.append({"Address": addr, "Function": "", **addr_meta})
         else:
             for fn in funcs:
-                out_rows.append({"Address": addr, "Function": fn})
+                out_rows.append({"Address": addr, "Function": fn, **addr_meta})
 
         if i % 50 == 0:
             print(f"  ↳ Processed {i}/{len(unique_addrs)}")
 
-    # Final cache save
-    save_cache(cache_path, cache)
+    cache.close()
 
-    # Create DataFrame of (Address, Function) and (optionally) merge back metadata
-    func_df = pd.DataFrame(out_rows)
-    # Keep some metadata columns if present
-    keep_cols = [c for c in ["Type", "Block", "extra_info", "Balance (ETH)"] if c in df.columns]
-    meta_df = df[["Address"] + keep_cols].drop_duplicates("Address")
-    merged = func_df.merge(meta_df, on="Address", how="left")
+    # DataFrame of (Address, Function) plus the metadata columns
+    merged = pd.DataFrame(out_rows, columns=["Address", "Function"] + keep_cols)
 
     # Write out
     Path(OUTPUT_FILE).parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,116 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fastjson
+
+_MISSING = object()
+
+class AbiCache:
+    """
+    Persistent address -> ABI store backed by SQLite.
+    A stored ``None`` marks a contract known to be unverified on Etherscan.
+    Writes are one upsert per address, so there is no periodic full-cache rewrite.
+    The JSON text is parsed at most once per address per process, and the
+    (name, arity) function index is built from the parsed list on first use.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS abi_cache ("
+            "address TEXT PRIMARY KEY, abi TEXT, fetched_at INTEGER)"
+        )
+        # Raw JSON text, parsed ABIs and function indexes seen this process
+        self._raw: Dict[str, Optional[str]] = {}
+        self._parsed: Dict[str, Any] = {}
+        self._index: Dict[str, Dict[Tuple[str, int], List[Dict[str, Any]]]] = {}
+        self._import_legacy_json(self.path.with_suffix(".json"))
+        # Negative cache: known-unverified addresses, answered without touching SQLite
+        self.unverified = {
+            r[0] for r in self._db.execute("SELECT address FROM abi_cache WHERE abi IS NULL")
+        }
+
+    def _import_legacy_json(self, json_path: Path) -> None:
+        """One-time migration from the old abi_cache.json into an empty table."""
+        if not json_path.exists():
+            return
+        if self._db.execute("SELECT 1 FROM abi_cache LIMIT 1").fetchone():
+            return
+        try:
+            data = fastjson.loads(json_path.read_text())
+        except Exception:
+            return
+        now = int(time.time())
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "INSERT OR IGNORE INTO abi_cache (address, abi, fetched_at) VALUES (?, ?, ?)",
+            ((k.lower(), None if v is None else fastjson.dumps(v), now) for k, v in data.items()),
+        )
+        self._db.execute("COMMIT")
+        print(f"🗃️  Imported {len(data)} cached ABIs from {json_path}")
+
+    def raw(self, address: str) -> Any:
+        """JSON text for `address`, ``None`` if unverified, or ``_MISSING`` if never fetched."""
+        key = address.lower()
+        if key in self.unverified:
+            return None
+        if key in self._raw:
+            return self._raw[key]
+        row = self._db.execute("SELECT abi FROM abi_cache WHERE address = ?", (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        self._raw[key] = row[0]
+        return row[0]
+
+    def __contains__(self, address: str) -> bool:
+        return self.raw(address) is not _MISSING
+
+    def parsed(self, address: str) -> Optional[List[Dict[str, Any]]]:
+        """Parsed ABI list for `address`, or ``None`` if missing/unverified."""
+        key = address.lower()
+        if key in self._parsed:
+            return self._parsed[key]
+        text = self.raw(key)
+        abi = None if text is _MISSING or text is None else fastjson.loads(text)
+        self._parsed[key] = abi
+        return abi
+
+    def index(self, address: str) -> Dict[Tuple[str, int], List[Dict[str, Any]]]:
+        """Function entries of the ABI grouped by (name, number of inputs)."""
+        key = address.lower()
+        idx = self._index.get(key)
+        if idx is None:
+            idx = {}
+            for e in self.parsed(key) or []:
+                if not isinstance(e, dict):
+                    continue
+                if e.get("type") != "function":
+                    continue
+                idx.setdefault((e.get("name"), len(e.get("inputs") or [])), []).append(e)
+            self._index[key] = idx
+        return idx
+
+    def set(self, address: str, abi: Any, raw: Optional[str] = None) -> None:
+        """Store a parsed ABI (or ``None``); pass `raw` to skip re-serializing fetched JSON."""
+        key = address.lower()
+        if abi is not None and raw is None:
+            raw = fastjson.dumps(abi)
+        self._raw[key] = None if abi is None else raw
+        if abi is None:
+            self.unverified.add(key)
+        else:
+            self.unverified.discard(key)
+        self._parsed[key] = abi
+        self._index.pop(key, None)
+        self._db.execute(
+            "INSERT OR REPLACE INTO abi_cache (address, abi, fetched_at) VALUES (?, ?, ?)",
+            (key, self._raw[key], int(time.time())),
+        )
+
+    def close(self) -> None:
+        self._db.close()
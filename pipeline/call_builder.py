@@ -1,38 +1,32 @@
 import os
-import json
-import time
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
+import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import fastjson
+from cache import AbiCache
+from providers import HTTP_ERRORS, http_client, make_provider
+from eth_utils.abi import get_abi_output_types
+from hexbytes import HexBytes
 
 # Web3
 from web3 import Web3
-from web3.exceptions import ContractLogicError
 from web3.middleware.proof_of_authority import ExtraDataToPOAMiddleware as geth_poa_middleware
 
-# --- Patch: helper to find single-address-arg function variant ---
-def _find_single_address_fn(abi_list, fn_name: str):
-    try:
-        for item in (abi_list or []):
-            if not isinstance(item, dict): 
-                continue
-            if item.get("type") != "function":
-                continue
-            if item.get("name") != fn_name:
-                continue
-            inputs = item.get("inputs") or []
-            if len(inputs) == 1 and str(inputs[0].get("type","")).lower() == "address":
-                return item
-    except Exception:
-        pass
-    return None
-
+# Arrow's multithreaded CSV reader with Arrow-backed columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_KW = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+except ImportError:
+    READ_CSV_KW = {}
 
 # --------------- Config ---------------
 MATCHES_CSV = os.getenv("SELECTOR_MATCHES_CSV", "results/selector_matches_targeted.csv")
-ABI_CACHE_PATH = Path(os.getenv("ABI_CACHE_PATH", "results/abi_cache.json"))
+ABI_CACHE_PATH = Path(os.getenv("ABI_CACHE_PATH", "results/abi_cache.sqlite"))
 OUTPUT_CSV = os.getenv("CALL_BUILDER_OUT", "results/call_builder_results.csv")
 
 # Network
@@ -58,32 +52,33 @@ if not FROM_ADDRESS:
 # Limits
 RATE_LIMIT_PER_SEC = float(os.getenv("ETHERSCAN_RPS", "4"))
 RETRY_COUNT = 3
-RETRY_DELAY = 1.5
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", "10"))  # JSON-RPC calls per POST (providers cap ~10)
+WRITE_EVERY = 500                                         # output rows buffered before appending to CSV
 
 # --------------- Web3 init ---------------
-w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": 30}))
+w3 = Web3(make_provider(RPC_URL))
 # Add POA middleware just in case (harmless on mainnet)
 w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-def load_cache(path: Path) -> Dict[str, Any]:
-    if path.exists():
-        try:
-            return json.loads(path.read_text())
-        except Exception:
-            return {}
-    return {}
-
-def save_cache(path: Path, data: Dict[str, Any]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(".json.tmp")
-    tmp.write_text(json.dumps(data))
-    tmp.replace(path)
+# Raw JSON-RPC batches share the provider's pooled (HTTP/2 when available) client
+rpc_session = http_client()
+
+# Etherscan fallback: pooled connections, retries (and Retry-After) handled by urllib3
+etherscan_session = requests.Session()
+etherscan_session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=RETRY_COUNT,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+    ),
+))
 
 def fetch_abi_from_etherscan(address: str) -> Optional[List[Dict[str, Any]]]:
     """Fetch ABI for address using Etherscan, if key is available."""
     if not ETHERSCAN_API_KEY:
         return None
-    import requests
     params = {
         "module": "contract",
         "action": "getabi",
@@ -91,89 +86,167 @@ def fetch_abi_from_etherscan(address: str) -> Optional[List[Dict[str, Any]]]:
         "apikey": ETHERSCAN_API_KEY,
     }
     url = "https://api.etherscan.io/api"
-    for attempt in range(1, RETRY_COUNT + 1):
+    try:
+        r = etherscan_session.get(url, params=params, timeout=20)
+        r.raise_for_status()
+        data = fastjson.loads(r.content)
+    except Exception:
+        return None
+    if data.get("status") == "1" and data.get("result"):
         try:
-            r = requests.get(url, params=params, timeout=20)
-            r.raise_for_status()
-            data = r.json()
-            if data.get("status") == "1" and data.get("result"):
-                try:
-                    return json.loads(data["result"])
-                except Exception:
-                    if isinstance(data["result"], list):
-                        return data["result"]
-            return None
+            return fastjson.loads(data["result"])
         except Exception:
-            if attempt == RETRY_COUNT:
-                return None
-            time.sleep(RETRY_DELAY)
+            if isinstance(data["result"], list):
+                return data["result"]
     return None
 
-def get_abi(address: str, cache: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+def get_abi(address: str, cache: AbiCache) -> Optional[List[Dict[str, Any]]]:
     key = address.lower()
     if key in cache:
-        return cache[key]
+        return cache.parsed(key)
     abi = fetch_abi_from_etherscan(key)
-    cache[key] = abi
+    cache.set(key, abi)
     return abi
 
-def list_zero_arg_functions(abi: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
-    """Return ABI entries for functions matching the given name with zero inputs."""
-    out = []
-    for e in abi:
-        if not isinstance(e, dict):
-            continue
-        if e.get("type") != "function":
-            continue
-        if e.get("name") != name:
-            continue
-        inputs = e.get("inputs") or []
-        if len(inputs) == 0:
-            out.append(e)
+OUT_COLUMNS = ["Address", "Function", "ABIInputs", "Mutability", "CallOK",
+               "CallReturn", "EstimateOK", "GasEstimate", "Notes"]
+
+class BatchRejected(Exception):
+    """Provider refused a JSON-RPC batch (too large or unsupported)."""
+
+def rpc_batch(calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """POST `calls` as one JSON-RPC batch; return responses in request order."""
+    body = [{"jsonrpc": "2.0", "id": i, **c} for i, c in enumerate(calls)]
+    r = rpc_session.post(RPC_URL, json=body if len(body) > 1 else body[0], timeout=30)
+    if r.status_code == 413:
+        raise BatchRejected(f"HTTP {r.status_code}")
+    r.raise_for_status()
+    data = fastjson.loads(r.content)
+    if isinstance(data, dict):
+        if len(body) > 1:
+            # A single error object in reply to a batch means the batch itself was refused
+            raise BatchRejected(str(data.get("error")))
+        data = [data]
+    by_id = {d.get("id"): d for d in data if isinstance(d, dict)}
+    return [by_id.get(i, {"error": {"message": "missing_response"}}) for i in range(len(calls))]
+
+def run_batched(calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Send `calls` in chunks of RPC_BATCH_SIZE, shrinking the chunk if the provider rejects it."""
+    global RPC_BATCH_SIZE
+    out: List[Dict[str, Any]] = []
+    i = 0
+    while i < len(calls):
+        chunk = calls[i:i + RPC_BATCH_SIZE]
+        try:
+            out.extend(rpc_batch(chunk))
+        except BatchRejected as e:
+            if RPC_BATCH_SIZE > 1:
+                RPC_BATCH_SIZE = max(1, RPC_BATCH_SIZE // 2)
+                print(f"  ⚠️ Batch rejected ({e}); retrying with batch size {RPC_BATCH_SIZE}")
+                continue
+            out.extend({"error": {"message": f"BatchRejected: {e}"}} for _ in chunk)
+        except HTTP_ERRORS + (ValueError,) as e:
+            out.extend({"error": {"message": e.__class__.__name__}} for _ in chunk)
+        i += len(chunk)
     return out
 
-def try_eth_call_and_estimate(addr: str, fn_abi: Dict[str, Any]) -> Tuple[bool, str, bool, int, str]:
+# lower-case address -> checksum address (each keccak computed once)
+CHECKSUM_CACHE: Dict[str, str] = {}
+
+def cs(address: str) -> str:
+    key = address.lower()
+    out = CHECKSUM_CACHE.get(key)
+    if out is None:
+        out = CHECKSUM_CACHE[key] = Web3.to_checksum_address(key)
+    return out
+
+# "name(types)" -> 0x-prefixed 4-byte selector
+SELECTOR_CACHE: Dict[str, str] = {}
+
+def selector(signature: str) -> str:
+    sel = SELECTOR_CACHE.get(signature)
+    if sel is None:
+        sel = SELECTOR_CACHE[signature] = Web3.to_hex(Web3.keccak(text=signature)[:4])
+    return sel
+
+def _error_note(prefix: str, err: Dict[str, Any]) -> str:
+    msg = str(err.get("message") or err.get("code") or "error")
+    if "revert" in msg.lower():
+        return f"revert: {msg}" if prefix == "call_error" else f"{prefix}: revert"
+    return f"{prefix}: {msg}"
+
+def _checksum_outputs(output: Dict[str, Any], val: Any) -> Any:
+    """Checksum every address in one decoded output (the codec returns them lower-case)."""
+    typ = output.get("type", "")
+    if typ.endswith("]"):
+        inner = dict(output, type=typ[:typ.rindex("[")])
+        return [_checksum_outputs(inner, v) for v in val]
+    if typ == "tuple":
+        return tuple(_checksum_outputs(c, v) for c, v in zip(output.get("components") or [], val))
+    if typ == "address":
+        return cs(val)
+    return val
+
+def decode_call_return(fn_abi: Dict[str, Any], ret_hex: str) -> str:
+    """Decode raw eth_call output the way ContractFunction.call() would, as a string."""
+    vals = w3.codec.decode(get_abi_output_types(fn_abi), HexBytes(ret_hex))
+    vals = [_checksum_outputs(o, v) for o, v in zip(fn_abi.get("outputs") or [], vals)]
+    return str(vals[0] if len(vals) == 1 else vals)
+
+def try_eth_call_and_estimate(targets: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[bool, str, bool, int, str]]:
     """
-    Attempt eth_call and gas estimation for a zero-arg function.
-    Returns: (call_ok, call_ret, est_ok, gas_est, note)
+    Attempt eth_call and gas estimation for zero-arg functions, batched over JSON-RPC.
+    `targets` is a list of (address, fn_abi).
+    Returns one (call_ok, call_ret, est_ok, gas_est, note) per target, in order.
     """
-    contract = w3.eth.contract(address=Web3.to_checksum_address(addr), abi=[fn_abi])
-    # Build the function object by name (zero args)
-    fn = contract.get_function_by_signature(f"{fn_abi['name']}()")()
-
-    # eth_call (simulation) - even non-view can be simulated; may revert
-    call_ok, call_ret, note = False, "", ""
-    try:
+    calls = []
+    for addr, fn_abi in targets:
+        # Zero-arg calldata is just the 4-byte selector
         # Use from=FROM_ADDRESS so msg.sender checks are realistic
-        ret = fn.call({"from": FROM_ADDRESS})
-        call_ok = True
-        # Represent return as string
-        call_ret = str(ret)
-    except ContractLogicError as e:
-        note = f"revert: {e}"
-    except Exception as e:
-        note = f"call_error: {e.__class__.__name__}"
-
-    # estimateGas
-    est_ok, gas_est = False, 0
-    try:
-        tx = fn.build_transaction({"from": FROM_ADDRESS})
-        gas_est = w3.eth.estimate_gas(tx)
-        est_ok = True
-    except Exception as e:
-        # leave as False
-        if note:
-            note += f"; "
-        note += f"est_error: {e.__class__.__name__}"
+        tx = {"from": FROM_ADDRESS, "to": cs(addr), "data": selector(f"{fn_abi['name']}()")}
+        # eth_call (simulation) - even non-view can be simulated; may revert
+        calls.append({"method": "eth_call", "params": [tx, "latest"]})
+        calls.append({"method": "eth_estimateGas", "params": [tx]})
+
+    responses = run_batched(calls)
+
+    results = []
+    for n, (addr, fn_abi) in enumerate(targets):
+        call_resp, est_resp = responses[2 * n], responses[2 * n + 1]
+
+        call_ok, call_ret, note = False, "", ""
+        if "error" in call_resp:
+            note = _error_note("call_error", call_resp["error"])
+        else:
+            try:
+                call_ret = decode_call_return(fn_abi, call_resp.get("result") or "0x")
+                call_ok = True
+            except Exception as e:
+                note = f"call_error: {e.__class__.__name__}"
+
+        est_ok, gas_est = False, 0
+        if "error" in est_resp:
+            if note:
+                note += "; "
+            note += _error_note("est_error", est_resp["error"])
+        else:
+            try:
+                gas_est = int(est_resp["result"], 16)
+                est_ok = True
+            except Exception as e:
+                if note:
+                    note += "; "
+                note += f"est_error: {e.__class__.__name__}"
 
-    return call_ok, call_ret, est_ok, int(gas_est) if est_ok else 0, note
+        results.append((call_ok, call_ret, est_ok, gas_est if est_ok else 0, note))
+    return results
 
 def main():
     print(f"🔧 Call Builder starting | RPC={RPC_URL}")
     print(f"📥 Reading matches: {MATCHES_CSV}")
     if not Path(MATCHES_CSV).exists():
         raise SystemExit(f"❌ Missing input CSV: {MATCHES_CSV}")
-    df = pd.read_csv(MATCHES_CSV)
+    df = pd.read_csv(MATCHES_CSV, **READ_CSV_KW)
 
     if "Address" not in df.columns or "Function" not in df.columns:
         raise SystemExit("❌ CSV must contain 'Address' and 'Function' columns.")
@@ -182,10 +255,63 @@ def main():
     pairs = df[["Address", "Function"]].dropna().drop_duplicates().values.tolist()
     print(f"🧩 Unique targets: {len(pairs)}")
 
-    cache = load_cache(ABI_CACHE_PATH)
-    out_rows = []
+    cache = AbiCache(ABI_CACHE_PATH)
+    # Output is accumulated column-wise; one list per OUT_COLUMNS entry
+    cols: Dict[str, List[Any]] = {c: [] for c in OUT_COLUMNS}
+    addrs, funcs, abi_inputs, muts = cols["Address"], cols["Function"], cols["ABIInputs"], cols["Mutability"]
+    call_oks, call_rets, est_oks, gas_ests, notes = (
+        cols["CallOK"], cols["CallReturn"], cols["EstimateOK"], cols["GasEstimate"], cols["Notes"])
+
+    def add_row(addr, fn_name, n_inputs, mut="", note=""):
+        addrs.append(addr)
+        funcs.append(fn_name)
+        abi_inputs.append(n_inputs)
+        muts.append(mut)
+        call_oks.append(False)
+        call_rets.append("")
+        est_oks.append(False)
+        gas_ests.append(0)
+        notes.append(note)
+        return len(addrs) - 1
+
+    # Rows awaiting their batched eth_call/estimateGas results: (row index, addr, fn_abi)
+    pending: List[Tuple[int, str, Dict[str, Any]]] = []
+
+    def flush_pending():
+        results = try_eth_call_and_estimate([(addr, fn_abi) for _, addr, fn_abi in pending])
+        for (idx, _, _), (call_ok, call_ret, est_ok, gas_est, note) in zip(pending, results):
+            call_oks[idx] = call_ok
+            call_rets[idx] = call_ret
+            est_oks[idx] = est_ok
+            gas_ests[idx] = gas_est
+            notes[idx] = note
+        pending.clear()
+
+    # Output is streamed: header now, then completed rows every WRITE_EVERY
+    Path(OUTPUT_CSV).parent.mkdir(parents=True, exist_ok=True)
+    out_f = open(OUTPUT_CSV, "w", newline="")
+    pd.DataFrame(columns=OUT_COLUMNS).to_csv(out_f, index=False)
+    written = ok_calls = ok_est = 0
+    preview = None
+
+    def write_chunk():
+        nonlocal written, ok_calls, ok_est, preview
+        if pending:
+            flush_pending()
+        chunk = pd.DataFrame(cols)
+        chunk.to_csv(out_f, header=False, index=False)
+        out_f.flush()
+        written += len(chunk)
+        ok_calls += int((chunk["CallOK"] == True).sum())
+        ok_est += int((chunk["EstimateOK"] == True).sum())
+        if preview is None and not chunk.empty:
+            preview = chunk.head(10)
+        for lst in cols.values():
+            lst.clear()
 
     for i, (addr, fn_name) in enumerate(pairs, 1):
+        if len(addrs) >= WRITE_EVERY:
+            write_chunk()
         addr = str(addr).strip()
         fn_name = str(fn_name).strip()
         if not addr or not fn_name:
@@ -194,134 +320,37 @@ def main():
         # Load ABI from cache or etherscan
         abi = get_abi(addr, cache)
         if not abi:
-            out_rows.append({
-                "Address": addr,
-                "Function": fn_name,
-                "ABIInputs": 0,
-                "Mutability": "",
-                "CallOK": False,
-                "CallReturn": "",
-                "EstimateOK": False,
-                "GasEstimate": 0,
-                "Notes": "no_abi"
-            })
-            if i % 25 == 0:
-                save_cache(ABI_CACHE_PATH, cache)
+            add_row(addr, fn_name, 0, note="no_abi")
             continue
 
         # Find zero-arg variants of this function
-        matches = list_zero_arg_functions(abi, fn_name)
+        matches = cache.index(addr).get((fn_name, 0), [])
         if not matches:
-            out_rows.append({
-                "Address": addr,
-                "Function": fn_name,
-                "ABIInputs": -1,
-                "Mutability": "",
-                "CallOK": False,
-                "CallReturn": "",
-                "EstimateOK": False,
-                "GasEstimate": 0,
-                "Notes": "requires_args_or_not_found"
-            })
-            if i % 25 == 0:
-                save_cache(ABI_CACHE_PATH, cache)
+            add_row(addr, fn_name, -1, note="requires_args_or_not_found")
             continue
 
-        # Try each zero-arg overload (usually 1)
+        # Queue each zero-arg overload (usually 1); results are filled in per batch
         for fn_abi in matches:
-            mut = fn_abi.get("stateMutability", "")
-            call_ok, call_ret, est_ok, gas_est, note = try_eth_call_and_estimate(addr, fn_abi)
-
-            out_rows.append({
-                "Address": addr,
-                "Function": fn_name,
-                "ABIInputs": 0,
-                "Mutability": mut,
-                "CallOK": call_ok,
-                "CallReturn": call_ret,
-                "EstimateOK": est_ok,
-                "GasEstimate": gas_est,
-                "Notes": note
-            })
+            idx = add_row(addr, fn_name, 0, fn_abi.get("stateMutability", ""))
+            pending.append((idx, addr, fn_abi))
+        if 2 * len(pending) >= RPC_BATCH_SIZE:
+            flush_pending()
 
         if i % 20 == 0 or i == len(pairs):
             print(f"  ↳ Processed {i}/{len(pairs)} targets")
 
-        # Periodically persist ABI cache
-        if i % 25 == 0:
-            save_cache(ABI_CACHE_PATH, cache)
-
-    # Final cache save
-    save_cache(ABI_CACHE_PATH, cache)
-
-    # Save output
-    out_df = pd.DataFrame(out_rows)
-    Path(OUTPUT_CSV).parent.mkdir(parents=True, exist_ok=True)
-    out_df
-
-# === Patch: attempt estimates for single-address-arg functions using MY_ADDRESS ===
-try:
-    _MY_ADDRESS = Web3.to_checksum_address(os.getenv("MY_ADDRESS","0x000000000000000000000000000000000000dead"))
-    # Load inputs/outputs DataFrame if available in scope: df (call targets) -> name may differ. 
-    # We'll operate on 'out_rows' just before writing results.
-    if 'out_rows' in locals() and isinstance(out_rows, list):
-        improved = 0
-        # Build a quick address->ABI cache
-        _abi_cache_path = Path("results/abi_cache.json")
-        _abi_cache = {}
-        if _abi_cache_path.exists():
-            try:
-                import json as _json
-                _abi_cache = _json.loads(_abi_cache_path.read_text())
-            except Exception:
-                _abi_cache = {}
-        for i,row in enumerate(out_rows):
-            try:
-                if int(row.get("ABIInputs", -1)) != 1:
-                    continue
-                if row.get("EstimateOK", False):
-                    continue
-                addr = Web3.to_checksum_address(str(row["Address"]).strip())
-                fn_name = str(row["Function"]).strip()
-                abi = _abi_cache.get(addr.lower())
-                if not abi:
-                    continue
-                # Find matching 1-address function
-                item = _find_single_address_fn(abi, fn_name)
-                if not item:
-                    continue
-                # Build stub ABI and function
-                w3 = Web3(Web3.HTTPProvider(os.getenv("RPC_URL") or os.getenv("WEB3_RPC") or os.getenv("RPC") or ""))
-                if not w3.is_connected():
-                    continue
-                contract = w3.eth.contract(address=addr, abi=[item])
-                fn = contract.get_function_by_signature(f"{fn_name}(address)")(_MY_ADDRESS)
-                # estimate
-                est = w3.eth.estimate_gas({"from": _MY_ADDRESS, "to": addr, "data": fn._encode_transaction_data()})
-                row["CallOK"] = True
-                row["EstimateOK"] = True
-                row["GasEstimate"] = int(est)
-                row["Notes"] = (row.get("Notes","") + "; addr1_estimated").strip("; ")
-                improved += 1
-            except Exception:
-                # leave as-is if anything fails
-                pass
-        if improved:
-            print(f"[call_builder patch] Estimated {improved} single-address functions.")
-except Exception:
-    pass
-
-.to_csv(OUTPUT_CSV, index=False)
+    if addrs:
+        write_chunk()
+    out_f.close()
+    cache.close()
 
     # Summary
-    ok_calls = (out_df["CallOK"] == True).sum() if not out_df.empty else 0
-    ok_est   = (out_df["EstimateOK"] == True).sum() if not out_df.empty else 0
-    print(f"✅ Call Builder done → {OUTPUT_CSV}")
+    print(f"✅ Call Builder done → {OUTPUT_CSV} (rows: {written})")
     print(f"   • Successful eth_call: {ok_calls}")
     print(f"   • Successful gas estimates: {ok_est}")
-    if not out_df.empty:
+    if preview is not None:
         print("— Preview —")
-        print(out_df.head(10).to_string(index=False))
+        print(preview.to_string(index=False))
 
 if __name__ == "__main__":
     main()
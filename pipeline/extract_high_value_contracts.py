@@ -8,42 +8,48 @@ OUTPUT = Path("results/high_value_contract_targets.csv")
 if not INPUT.exists():
     raise SystemExit(f"❌ Missing input CSV: {INPUT}")
 
-# Read robustly: tolerate malformed lines
-df = pd.read_csv(INPUT, engine="python", on_bad_lines="skip")
+CHUNKSIZE = 500_000
 
-# Normalize column names (trim whitespace)
-df.rename(columns={c: c.strip() for c in df.columns}, inplace=True)
+# Sniff the header once so only the needed columns are parsed
+raw_cols = pd.read_csv(INPUT, nrows=0).columns
+strip_map = {c: c.strip() for c in raw_cols}
+cols = list(strip_map.values())
 
 # Find balance column
-balance_col = next((c for c in ["Balance (ETH)", "BalanceETH", "balance_eth", "Balance"] if c in df.columns), None)
+balance_col = next((c for c in ["Balance (ETH)", "BalanceETH", "balance_eth", "Balance"] if c in cols), None)
 if not balance_col:
-    raise SystemExit(f"❌ Could not find a balance column in: {list(df.columns)}")
-
-# Coerce balance to numeric
-df[balance_col] = pd.to_numeric(df[balance_col], errors="coerce")
+    raise SystemExit(f"❌ Could not find a balance column in: {cols}")
 
 # Address column
-addr_col = next((c for c in ["Address", "ChecksumAddress", "address"] if c in df.columns), None)
+addr_col = next((c for c in ["Address", "ChecksumAddress", "address"] if c in cols), None)
 if not addr_col:
-    raise SystemExit(f"❌ Could not find an address column in: {list(df.columns)}")
+    raise SystemExit(f"❌ Could not find an address column in: {cols}")
 
 # Type column (Contract/Wallet)
-type_col = next((c for c in ["Type", "type"] if c in df.columns), None)
-if type_col is None:
-    # default to Wallet if absent
-    df["Type"] = "Wallet"
-    type_col = "Type"
-
-before = len(df)
-filtered = df[
-    (df[type_col].astype(str).str.lower() == "contract") &
-    (df[balance_col] > 0)
-].copy()
+type_col = next((c for c in ["Type", "type"] if c in cols), None)
 
 # Keep a tidy subset of useful columns if present
-keep_cols = [col for col in [addr_col, "ChecksumAddress", balance_col, type_col, "Block", "TimestampUTC"] if col in df.columns]
-if keep_cols:
-    filtered = filtered[keep_cols]
+keep_cols = [col for col in dict.fromkeys([addr_col, "ChecksumAddress", balance_col, type_col, "Block", "TimestampUTC"]) if col in cols]
+usecols = [raw for raw, c in strip_map.items() if c in keep_cols]
+dtype = {raw: "string" for raw, c in strip_map.items() if c in (addr_col, "ChecksumAddress")}
+if type_col:
+    dtype.update({raw: "category" for raw, c in strip_map.items() if c == type_col})
+
+# Stream with the C parser and filter each chunk; malformed lines are reported and skipped
+before = 0
+kept = []
+for chunk in pd.read_csv(INPUT, engine="c", chunksize=CHUNKSIZE, usecols=usecols, dtype=dtype, on_bad_lines="warn"):
+    chunk.rename(columns=strip_map, inplace=True)
+    before += len(chunk)
+    if type_col is None:
+        # default to Wallet if absent
+        chunk["Type"] = "Wallet"
+    # Coerce balance to numeric
+    chunk[balance_col] = pd.to_numeric(chunk[balance_col], errors="coerce")
+    mask = (chunk[type_col or "Type"].str.lower() == "contract") & (chunk[balance_col] > 0)
+    kept.append(chunk.loc[mask, keep_cols])
+
+filtered = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=keep_cols)
 
 filtered = filtered.sort_values(by=balance_col, ascending=False)
 
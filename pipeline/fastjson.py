@@ -0,0 +1,16 @@
+# orjson (C/Rust parser) when installed, stdlib json otherwise.
+# loads() accepts str or bytes; dumps() always returns str.
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json
+
+    loads = json.loads
+
+    def dumps(obj) -> str:
+        return json.dumps(obj)
@@ -1,8 +1,18 @@
 import os
 import re
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+# Arrow's multithreaded CSV reader with Arrow-backed columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_KW = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    READ_CSV_KW = {}
+    STRING_DTYPE = "string"
+
 # Inputs (can override via env if you want)
 CALLS_CSV = os.getenv("CALL_BUILDER_RESULTS", "results/call_builder_results.csv")
 ENRICHED_CSV = os.getenv("ENRICHED_RESULTS", "results/dust_enriched_results_targeted.csv")
@@ -18,37 +28,65 @@ SCORE_THRESHOLD = int(os.getenv("SCORE_THRESHOLD", "4"))
 KEYWORDS = [k.strip().lower() for k in os.getenv("FILTER_KEYWORDS",
     "claim,withdraw,airdrop,harvest,collect,redeem,unstake,stake,mint,distribute,release,unlock,bonus,dividend"
 ).split(",") if k.strip()]
+# One alternation so the Function column is scanned once, not once per keyword
+# (kept as a pattern string: Arrow string columns take the regex text, not a compiled object)
+KEYWORD_PAT = "|".join(re.escape(k) for k in KEYWORDS) if KEYWORDS else None
+
+# Signal column -> score weight (penalties negative)
+SIGNAL_WEIGHTS = {
+    "sig_est_ok": 2,
+    "sig_gas_band": 2,
+    "sig_call_ok": 3,
+    "sig_keyword": 1,
+    "sig_nonview": 1,
+    "sig_balance": 1,
+    "pen_args": -2,
+    "pen_noabi": -1,
+}
+
+def flag(df: pd.DataFrame, col: str) -> pd.Series:
+    """Column == True as a plain bool Series (False where missing or NA)."""
+    if col not in df.columns:
+        return pd.Series(False, index=df.index)
+    return (df[col] == True).fillna(False).astype(bool)
 
 def main():
     if not Path(CALLS_CSV).exists():
         raise SystemExit(f"Missing {CALLS_CSV}")
-    calls = pd.read_csv(CALLS_CSV)
+    calls = pd.read_csv(CALLS_CSV, **READ_CSV_KW)
 
     # Merge balance info if present
     if Path(ENRICHED_CSV).exists():
-        enriched = pd.read_csv(ENRICHED_CSV)
+        enriched = pd.read_csv(ENRICHED_CSV, **READ_CSV_KW)
         if "Address" in enriched.columns and "Balance (ETH)" in enriched.columns:
             bal = enriched[["Address", "Balance (ETH)"]].drop_duplicates("Address")
             calls = calls.merge(bal, on="Address", how="left")
 
     # Normalize
-    calls["Function_str"] = calls["Function"].astype(str)
-    calls["fn_lower"] = calls["Function_str"].str.lower()
+    calls["fn_lower"] = calls["Function"].astype(STRING_DTYPE).str.lower()
     calls["Notes"] = calls.get("Notes", "").astype(str)
 
     # Signals
-    calls["sig_keyword"] = False
-    for kw in KEYWORDS:
-        calls["sig_keyword"] = calls["sig_keyword"] | calls["fn_lower"].str.contains(re.escape(kw), na=False)
+    if KEYWORD_PAT is not None:
+        calls["sig_keyword"] = calls["fn_lower"].str.contains(KEYWORD_PAT, regex=True, na=False)
+    else:
+        calls["sig_keyword"] = False
 
-    calls["sig_est_ok"] = calls.get("EstimateOK", False) == True
-    calls["sig_call_ok"] = calls.get("CallOK", False) == True
+    calls["sig_est_ok"] = flag(calls, "EstimateOK")
+    calls["sig_call_ok"] = flag(calls, "CallOK")
     calls["sig_gas_band"] = calls.get("GasEstimate", 0).fillna(0).between(GAS_MIN, GAS_MAX, inclusive="both")
-    calls["sig_nonview"] = ~calls.get("Mutability","").astype(str).str.lower().isin(["view","pure"])
+    # Mutability has a handful of distinct values: match view/pure on the categories, then on int codes
+    # (no Mutability column: nothing is known to be view/pure)
+    if "Mutability" in calls.columns:
+        mut = calls["Mutability"].astype("category")
+        view_codes = np.flatnonzero(mut.cat.categories.astype(str).str.lower().isin(["view", "pure"]))
+        calls["sig_nonview"] = ~mut.cat.codes.isin(view_codes)
+    else:
+        calls["sig_nonview"] = True
 
     # Penalties
-    calls["pen_args"] = calls["Notes"].str.contains("requires_args_or_not_found", na=False)
-    calls["pen_noabi"] = calls["Notes"].str.contains("no_abi", na=False)
+    calls["pen_args"] = calls["Notes"].str.contains("requires_args_or_not_found", regex=False, na=False)
+    calls["pen_noabi"] = calls["Notes"].str.contains("no_abi", regex=False, na=False)
 
     # Balance filter
     if "Balance (ETH)" in calls.columns:
@@ -56,17 +94,9 @@ def main():
     else:
         calls["sig_balance"] = True  # if we don't know, don't block
 
-    # Scoring (tweakable weights)
-    score = (
-        2 * calls["sig_est_ok"].astype(int) +
-        2 * calls["sig_gas_band"].astype(int) +
-        3 * calls["sig_call_ok"].astype(int) +
-        1 * calls["sig_keyword"].astype(int) +
-        1 * calls["sig_nonview"].astype(int) +
-        1 * calls["sig_balance"].astype(int) -
-        2 * calls["pen_args"].astype(int) -
-        1 * calls["pen_noabi"].astype(int)
-    )
+    # Scoring (tweakable weights): one (signals x rows) matrix, one dot product
+    sig = np.stack([calls[c].to_numpy(dtype=np.int16) for c in SIGNAL_WEIGHTS])
+    score = np.fromiter(SIGNAL_WEIGHTS.values(), dtype=np.int16, count=len(SIGNAL_WEIGHTS)) @ sig
     calls["ConfidenceScore"] = score
 
     # Shortlist
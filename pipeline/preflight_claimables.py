@@ -1,16 +1,38 @@
 import os
-import json
+import asyncio
+import hashlib
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import pandas as pd
 from dotenv import load_dotenv
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
+
+from cache import AbiCache
+from providers import make_async_provider
+
+# Arrow's multithreaded CSV reader with Arrow-backed columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_KW = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+except ImportError:
+    READ_CSV_KW = {}
 
 # -------- Config --------
 CALL_RESULTS_CSV = os.getenv("CALL_RESULTS_CSV", "results/call_builder_results.csv")
-ABI_CACHE_PATH = Path(os.getenv("ABI_CACHE_PATH", "results/abi_cache.json"))
+ABI_CACHE_PATH = Path(os.getenv("ABI_CACHE_PATH", "results/abi_cache.sqlite"))
 OUT_CSV = os.getenv("PREFLIGHT_OUT", "results/preflight_claimables.csv")
+CONCURRENCY = int(os.getenv("PREFLIGHT_CONCURRENCY", "32"))  # in-flight eth_calls
+WRITE_EVERY = 500                                            # calls gathered before appending hits to CSV
+PREVIEW_ROWS = 15
+OUT_COLUMNS = ["Address", "Function", "RawValue", "AsEther", "Note"]
+# Every call made (hits and zeros) so a re-run only calls functions it has not seen
+MANIFEST_CSV = os.getenv("PREFLIGHT_MANIFEST", "results/preflight_manifest.csv")
+MANIFEST_COLUMNS = ["Address", "Function", "Inputs", "ResultHash"]
+FORCE = os.getenv("FORCE", "0") == "1"   # ignore the manifest and rescan everything
+# Calls that errored this run (rewritten every run; they stay out of the manifest and are retried next time)
+RETRY_CSV = os.getenv("PREFLIGHT_RETRY", "results/preflight_retry.csv")
+RETRY_COLUMNS = ["Address", "Function", "Inputs", "Note"]
 
 load_dotenv()
 RPC = os.getenv("WEB3_PROVIDER_URL") or os.getenv("WEB3_PROVIDER") or os.getenv("ETH_RPC_URL")
@@ -18,7 +40,8 @@ FROM_ADDRESS = os.getenv("FROM_ADDRESS")
 if not RPC or not FROM_ADDRESS:
     raise SystemExit("❌ Need WEB3_PROVIDER_URL and FROM_ADDRESS in .env")
 
-w3 = Web3(Web3.HTTPProvider(RPC, request_kwargs={"timeout": 30}))
+# One shared async provider; its client keeps connections alive (HTTP/2 via httpx when installed)
+w3 = AsyncWeb3(make_async_provider(RPC))
 from_addr = Web3.to_checksum_address(FROM_ADDRESS)
 
 CANDIDATE_NAMES = [
@@ -29,14 +52,11 @@ CANDIDATE_NAMES = [
     "earned", "rewards", "reward", "accrued", "accruedRewards",
     "profit", "balanceToWithdraw",
 ]
+CANDIDATE_NAMES_LC = frozenset(c.lower() for c in CANDIDATE_NAMES)
+CANDIDATE_KEYWORDS = ("claim", "pend", "reward", "withdraw", "release", "releas", "accru", "avail", "earn")
 
-def load_cache(path: Path) -> Dict[str, Any]:
-    if path.exists():
-        try:
-            return json.loads(path.read_text())
-        except Exception:
-            return {}
-    return {}
+# address -> candidate function entries, tagged once per address
+CANDIDATE_INDEX: Dict[str, List[Dict[str, Any]]] = {}
 
 def find_candidate_funcs(abi: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     out = []
@@ -50,75 +70,195 @@ def find_candidate_funcs(abi: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             continue
         name = (e.get("name") or "").strip()
         lname = name.lower()
-        if lname in [c.lower() for c in CANDIDATE_NAMES]:
+        if lname in CANDIDATE_NAMES_LC or any(kw in lname for kw in CANDIDATE_KEYWORDS):
             out.append(e)
-        else:
-            for kw in ["claim", "pend", "reward", "withdraw", "release", "releas", "accru", "avail", "earn"]:
-                if kw in lname:
-                    out.append(e)
-                    break
     return out
 
-def call_func(contract, fn_abi, from_addr) -> Tuple[int, str]:
+def get_candidate_funcs(address: str, abi: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    key = address.lower()
+    funcs = CANDIDATE_INDEX.get(key)
+    if funcs is None:
+        funcs = CANDIDATE_INDEX[key] = find_candidate_funcs(abi)
+    return funcs
+
+# lower-case address -> checksum address (each keccak computed once)
+CHECKSUM_CACHE: Dict[str, str] = {}
+
+def cs(address: str) -> str:
+    key = address.lower()
+    out = CHECKSUM_CACHE.get(key)
+    if out is None:
+        out = CHECKSUM_CACHE[key] = Web3.to_checksum_address(key)
+    return out
+
+def interpret_return(ret: Any) -> Tuple[int, str]:
+    if isinstance(ret, int):
+        return int(ret), ""
+    if isinstance(ret, (list, tuple)) and ret:
+        for v in ret:
+            if isinstance(v, int):
+                return int(v), "tuple_pick_first_int"
+    return 0, "non_numeric"
+
+async def call_func_async(contract, fn_abi, from_addr, sem: asyncio.Semaphore) -> Tuple[int, str]:
     # Try to call the function. Supports 0-arg and 1-arg (address).
     name = fn_abi.get("name")
     inputs = fn_abi.get("inputs") or []
     try:
         if len(inputs) == 0:
             fn = contract.get_function_by_signature(f"{name}()")()
-            ret = fn.call({"from": from_addr})
         elif len(inputs) == 1 and (inputs[0].get("type") in ("address","address payable")):
             fn = contract.get_function_by_signature(f"{name}(address)")(from_addr)
-            ret = fn.call({"from": from_addr})
         else:
             return 0, "skip:requires_params"
-        if isinstance(ret, int):
-            return int(ret), ""
-        if isinstance(ret, (list, tuple)) and ret:
-            for v in ret:
-                if isinstance(v, int):
-                    return int(v), "tuple_pick_first_int"
-        return 0, "non_numeric"
+        async with sem:
+            ret = await fn.call({"from": from_addr})
+        return interpret_return(ret)
     except Exception as e:
         return 0, f"error:{e.__class__.__name__}"
 
+ScanKey = Tuple[str, str, int]
+
+def scan_key(addr: str, fn_abi: Dict[str, Any]) -> ScanKey:
+    # Arity is part of the key so overloads sharing a name are tracked separately
+    return addr.lower(), fn_abi.get("name") or "", len(fn_abi.get("inputs") or [])
+
+def result_hash(raw: int, note: str) -> str:
+    return hashlib.blake2b(f"{raw}|{note}".encode(), digest_size=8).hexdigest()
+
+def load_manifest(path: Path) -> Set[ScanKey]:
+    if FORCE or not path.exists():
+        return set()
+    m = pd.read_csv(path, usecols=["Address", "Function", "Inputs"], dtype=str, keep_default_na=False)
+    return set(zip(m["Address"].str.lower(), m["Function"], m["Inputs"].astype(int)))
+
+async def scan(addrs: List[str], cache: AbiCache, out_f, manifest_f, retry_f,
+               scanned: Set[ScanKey]) -> Tuple[int, int, int, pd.DataFrame]:
+    """Call candidate functions not yet in `scanned` and append hits to `out_f`
+    (every call that returned a result to `manifest_f`, every errored call to `retry_f`)
+    every WRITE_EVERY calls.
+    Returns (rows written, calls skipped, calls errored, top rows for the console preview)."""
+    sem = asyncio.Semaphore(CONCURRENCY)
+    targets = []
+    tasks = []
+    written = 0
+    skipped = 0
+    errored = 0
+    heads = []  # best PREVIEW_ROWS of each written chunk, combined once at the end
+
+    async def drain():
+        nonlocal written, errored
+        results = await asyncio.gather(*tasks)
+        # Column-wise output: one list per CSV column
+        out_addrs, out_funcs, raws, as_eth, notes = [], [], [], [], []
+        m_addrs, m_funcs, m_inputs, m_hashes = [], [], [], []
+        r_addrs, r_funcs, r_inputs, r_notes = [], [], [], []
+        for (addr, fn_abi), (raw, note) in zip(targets, results):
+            _, name, arity = scan_key(addr, fn_abi)
+            # Failed calls (mostly timeouts / rate limits) stay out of the manifest and out_f so a
+            # resume retries them without piling up stale error rows
+            if note.startswith("error"):
+                r_addrs.append(addr)
+                r_funcs.append(name)
+                r_inputs.append(arity)
+                r_notes.append(note)
+                continue
+            m_addrs.append(addr)
+            m_funcs.append(name)
+            m_inputs.append(arity)
+            m_hashes.append(result_hash(raw, note))
+            if raw > 0:
+                out_addrs.append(addr)
+                out_funcs.append(fn_abi.get("name"))
+                raws.append(raw)
+                as_eth.append(raw / 1e18)
+                notes.append(note)
+        targets.clear()
+        tasks.clear()
+        # Hits go out before the manifest so an interrupted run never marks an unwritten hit as done
+        chunk = pd.DataFrame(dict(zip(OUT_COLUMNS, (out_addrs, out_funcs, raws, as_eth, notes))))
+        if not chunk.empty:
+            chunk = chunk.sort_values(["AsEther","RawValue"], ascending=[False,False])
+            chunk.to_csv(out_f, header=False, index=False)
+            out_f.flush()
+            written += len(chunk)
+            heads.append(chunk.head(PREVIEW_ROWS))
+        pd.DataFrame(dict(zip(MANIFEST_COLUMNS, (m_addrs, m_funcs, m_inputs, m_hashes)))).to_csv(
+            manifest_f, header=False, index=False)
+        manifest_f.flush()
+        if r_addrs:
+            pd.DataFrame(dict(zip(RETRY_COLUMNS, (r_addrs, r_funcs, r_inputs, r_notes)))).to_csv(
+                retry_f, header=False, index=False)
+            retry_f.flush()
+            errored += len(r_addrs)
+
+    try:
+        for i, addr in enumerate(addrs, 1):
+            abi = cache.parsed(addr)
+            if not abi:
+                continue
+            ctr = w3.eth.contract(address=cs(addr), abi=abi)
+            for fn_abi in get_candidate_funcs(addr, abi):
+                if scan_key(addr, fn_abi) in scanned:
+                    skipped += 1
+                    continue
+                targets.append((addr, fn_abi))
+                tasks.append(asyncio.create_task(call_func_async(ctr, fn_abi, from_addr, sem)))
+            # Let queued calls hit the wire while later ABIs are still being parsed/indexed
+            await asyncio.sleep(0)
+            if len(tasks) >= WRITE_EVERY:
+                await drain()
+            if i % 50 == 0:
+                print(f"  ↳ Scanned {i}/{len(addrs)} contracts")
+
+        if tasks:
+            await drain()
+    finally:
+        # The httpx client is bound to this event loop, which asyncio.run closes after scan returns
+        aclose = getattr(w3.provider, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if not heads:
+        return written, skipped, errored, pd.DataFrame(columns=OUT_COLUMNS)
+    top = pd.concat(heads).sort_values(["AsEther","RawValue"], ascending=[False,False]).head(PREVIEW_ROWS)
+    return written, skipped, errored, top
+
 def main():
     if not Path(CALL_RESULTS_CSV).exists():
         raise SystemExit(f"Missing {CALL_RESULTS_CSV}")
-    df = pd.read_csv(CALL_RESULTS_CSV)
+    df = pd.read_csv(CALL_RESULTS_CSV, **READ_CSV_KW)
     if "Address" not in df.columns:
         raise SystemExit("CSV must contain Address column")
 
     addrs = sorted(set(str(a).strip() for a in df["Address"].dropna().tolist()))
-    cache = load_cache(ABI_CACHE_PATH)
+    cache = AbiCache(ABI_CACHE_PATH)
 
-    rows = []
-    for i, addr in enumerate(addrs, 1):
-        key = addr.lower()
-        abi = cache.get(key)
-        if not abi:
-            continue
-        ctr = w3.eth.contract(address=Web3.to_checksum_address(addr), abi=abi)
-        funcs = find_candidate_funcs(abi)
-        for fn_abi in funcs:
-            raw, note = call_func(ctr, fn_abi, from_addr)
-            if raw > 0 or note.startswith("error"):
-                rows.append({
-                    "Address": addr,
-                    "Function": fn_abi.get("name"),
-                    "RawValue": raw,
-                    "AsEther": raw / 1e18,
-                    "Note": note
-                })
-        if i % 50 == 0:
-            print(f"  ↳ Scanned {i}/{len(addrs)} contracts")
-
-    out = pd.DataFrame(rows).sort_values(["AsEther","RawValue"], ascending=[False,False])
-    Path(OUT_CSV).parent.mkdir(parents=True, exist_ok=True)
-    out.to_csv(OUT_CSV, index=False)
-    print(f"✅ Preflight done → {OUT_CSV} (rows: {len(out)})")
-    if len(out) > 0:
-        print(out.head(15).to_string(index=False))
+    # Resume: append to the previous run's output unless FORCE or nothing to resume from
+    out_path, manifest_path = Path(OUT_CSV), Path(MANIFEST_CSV)
+    scanned = load_manifest(manifest_path)
+    resume = bool(scanned) and out_path.exists()
+    if resume:
+        print(f"↩️  Resuming: {len(scanned)} calls already in {manifest_path}")
+    else:
+        scanned = set()
+
+    # Results are streamed; each written chunk is sorted by value
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    mode = "a" if resume else "w"
+    with open(out_path, mode, newline="") as out_f, open(manifest_path, mode, newline="") as manifest_f, \
+            open(RETRY_CSV, "w", newline="") as retry_f:
+        if not resume:
+            pd.DataFrame(columns=OUT_COLUMNS).to_csv(out_f, index=False)
+            pd.DataFrame(columns=MANIFEST_COLUMNS).to_csv(manifest_f, index=False)
+        pd.DataFrame(columns=RETRY_COLUMNS).to_csv(retry_f, index=False)
+        written, skipped, errored, top = asyncio.run(scan(addrs, cache, out_f, manifest_f, retry_f, scanned))
+    cache.close()
+
+    print(f"✅ Preflight done → {OUT_CSV} (new rows: {written}, skipped already scanned: {skipped})")
+    if errored:
+        print(f"⚠️  {errored} calls errored → {RETRY_CSV} (retried on the next run)")
+    if written > 0:
+        print(top.to_string(index=False))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,69 @@
+from typing import Any, Optional
+
+import requests
+from web3 import AsyncHTTPProvider, HTTPProvider
+
+# httpx (with h2) lets many JSON-RPC POSTs share one multiplexed HTTP/2 connection.
+# Without it everything falls back to web3's stock requests/aiohttp providers.
+try:
+    import h2  # noqa: F401  (required by httpx for http2=True)
+    import httpx
+except ImportError:
+    httpx = None
+
+TIMEOUT = 30
+LIMITS = {"max_keepalive_connections": 32, "max_connections": 64}
+HEADERS = {"Content-Type": "application/json"}
+
+if httpx is not None:
+    HTTP_ERRORS = (httpx.HTTPError, requests.RequestException)
+else:
+    HTTP_ERRORS = (requests.RequestException,)
+
+_client: Optional[Any] = None
+
+def http_client() -> Any:
+    """Process-wide sync HTTP client: httpx over HTTP/2 if installed, else a requests.Session."""
+    global _client
+    if _client is None:
+        if httpx is not None:
+            _client = httpx.Client(http2=True, timeout=TIMEOUT, limits=httpx.Limits(**LIMITS))
+        else:
+            _client = requests.Session()
+    return _client
+
+class HTTPXProvider(HTTPProvider):
+    """HTTPProvider that POSTs through the shared httpx HTTP/2 client."""
+
+    def make_request(self, method, params):
+        r = http_client().post(self.endpoint_uri, content=self.encode_rpc_request(method, params), headers=HEADERS)
+        r.raise_for_status()
+        return self.decode_rpc_response(r.content)
+
+class AsyncHTTPXProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider backed by an httpx.AsyncClient, created on first use inside the running loop."""
+
+    _aclient = None
+
+    async def make_request(self, method, params):
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(http2=True, timeout=TIMEOUT, limits=httpx.Limits(**LIMITS))
+        r = await self._aclient.post(self.endpoint_uri, content=self.encode_rpc_request(method, params), headers=HEADERS)
+        r.raise_for_status()
+        return self.decode_rpc_response(r.content)
+
+    async def aclose(self):
+        """Close the httpx client (inside the loop that created it); the next request opens a new one."""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+def make_provider(url: str) -> HTTPProvider:
+    if httpx is not None:
+        return HTTPXProvider(url)
+    return HTTPProvider(url, request_kwargs={"timeout": TIMEOUT})
+
+def make_async_provider(url: str) -> AsyncHTTPProvider:
+    if httpx is not None:
+        return AsyncHTTPXProvider(url)
+    return AsyncHTTPProvider(url, request_kwargs={"timeout": TIMEOUT})
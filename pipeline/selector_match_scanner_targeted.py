@@ -3,8 +3,24 @@ import os
 import re
 import uuid
 from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
 
+# Arrow's multithreaded CSV reader with Arrow-backed columns when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_KW = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    READ_CSV_KW = {"dtype": {"Address": "string", "Function": "string"}}
+    STRING_DTYPE = "string"
+
+# pyahocorasick scans each name once for all keywords; without it fall back to one regex alternation
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # ---------- Config (expanded by default) ----------
 INPUT_FILE = os.getenv("ABI_SIG_CSV", "results/abi_signatures_targeted.csv")
 OUTPUT_FILE = os.getenv("SELECTOR_MATCHES_OUT", "results/selector_matches_targeted.csv")
@@ -43,7 +59,8 @@ PREVIEW_ROWS = int(os.getenv("SELECTOR_PREVIEW_ROWS", "10"))
 if not os.path.exists(INPUT_FILE):
     raise SystemExit(f"❌ Missing input: {INPUT_FILE}")
 
-df = pd.read_csv(INPUT_FILE)
+# Every column is passed through to the output, so none are dropped at read time
+df = pd.read_csv(INPUT_FILE, **READ_CSV_KW)
 
 if "Function" not in df.columns:
     # Try alias
@@ -63,17 +80,46 @@ if "Address" not in df.columns:
     raise SystemExit("❌ 'Address' column missing.")
 
 # ---------- Match (case-insensitive substring) ----------
-func_lower = df["Function"].astype(str).str.lower()
-
-mask_any = pd.Series(False, index=df.index)
-matched_kw_series = pd.Series("", index=df.index, dtype=object)
-
+# Names repeat heavily across contracts, so match each distinct name once and
+# broadcast back through the category codes (-1 = missing name, never matches)
+func_cat = df["Function"].astype("category").cat
+func_lower = pd.Series(func_cat.categories).astype(STRING_DTYPE).str.lower()
+
+# One alternation, one pass over the column. Longest keywords first so that
+# e.g. "claimall" is reported instead of its prefix "claim".
+KW_PATTERN = "(" + "|".join(re.escape(k.lower()) for k in sorted(KEYWORDS, key=len, reverse=True)) + ")"
+KW_BY_LOWER = {}
 for k in KEYWORDS:
-    pat = re.escape(k.lower())
-    hit = func_lower.str.contains(pat, regex=True, na=False)
-    newly = hit & (~mask_any)
-    matched_kw_series.loc[newly] = k
-    mask_any = mask_any | hit
+    KW_BY_LOWER.setdefault(k.lower(), k)
+
+def build_automaton(keywords):
+    A = ahocorasick.Automaton()
+    for k in keywords:
+        A.add_word(k.lower(), k.lower())
+    A.make_automaton()
+    return A
+
+def first_match(A, s):
+    """Same pick as the alternation regex: leftmost match, longest keyword on a tie."""
+    best = None
+    best_key = None
+    for end, k in A.iter(s):
+        key = (end - len(k), -len(k))
+        if best_key is None or key < best_key:
+            best, best_key = k, key
+    return best
+
+if ahocorasick is not None and KW_BY_LOWER:
+    KW_AUTOMATON = build_automaton(KW_BY_LOWER)
+    cat_matched = pd.Series([first_match(KW_AUTOMATON, s) if isinstance(s, str) else None
+                             for s in func_lower.tolist()], dtype=object)
+else:
+    cat_matched = func_lower.str.extract(KW_PATTERN, expand=False)
+# One trailing None so code -1 picks "no match"
+cat_kw = np.append(cat_matched.map(KW_BY_LOWER).to_numpy(dtype=object, na_value=None), None)
+matched_kw = pd.Series(cat_kw[func_cat.codes.to_numpy()], index=df.index, dtype=object)
+mask_any = matched_kw.notna()
+matched_kw_series = matched_kw.fillna("")
 
 matches = df[mask_any].copy()
 
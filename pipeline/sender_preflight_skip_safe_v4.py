@@ -3,13 +3,22 @@ import os
 import re
 import math
 import csv
-import json
+import fastjson
+from providers import HTTP_ERRORS, http_client
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from web3 import Web3
 
+# pyahocorasick checks each name against the whole blocklist in one pass; without it fall back to the regex
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # ---------------- Config ----------------
 CALL_RESULTS_CSV = os.getenv("CALL_RESULTS_CSV", "results/call_builder_results.csv")
 PREFLIGHT_CSV = os.getenv("PREFLIGHT_CSV", "results/preflight_claimables.csv")
@@ -23,6 +32,17 @@ REQUIRE_POSITIVE = os.getenv("REQUIRE_POSITIVE", "0") == "1"
 ALLOW_ADMINY = os.getenv("ALLOW_ADMINY", "0") == "1"   # set to 1 to allow admin-like names
 MAX_TX = int(os.getenv("MAX_TX", "1"))
 MIN_BAL_ETH = float(os.getenv("MIN_BAL_ETH", "0.0"))
+WAIT_FOR_RECEIPT = os.getenv("WAIT_FOR_RECEIPT", "1") == "1"
+RPC_WORKERS = int(os.getenv("RPC_WORKERS", "8"))        # concurrent receipt waits
+
+# Only the columns the filters use, with compact dtypes (any of them may be absent)
+CALL_RESULTS_DTYPES = {
+    "Address": "string", "Function": "string", "GasEstimate": "Int64",
+    "CallOK": "boolean", "EstimateOK": "boolean", "ABIInputs": "Int16",
+    "Mutability": "category", "Balance (ETH)": "float64",
+}
+LOG_DTYPES = {"address": "string", "function": "string"}
+PREFLIGHT_DTYPES = {"Address": "string", "Function": "string"}
 
 # Gas & fees
 GAS_BUMP = float(os.getenv("GAS_BUMP", "1.15"))
@@ -42,12 +62,11 @@ if not FROM_ADDRESS:
 if ENABLE_SEND and not PRIVATE_KEY:
     raise SystemExit("❌ ENABLE_SEND=1 but no PRIVATE_KEY in .env")
 
-w3 = Web3(Web3.HTTPProvider(RPC, request_kwargs={"timeout": 30}))
-assert w3.is_connected(), f"Cannot connect to RPC {RPC}"
 from_addr = Web3.to_checksum_address(FROM_ADDRESS)
 
-def calc_fees(w3: Web3):
-    blk = w3.eth.get_block("latest")
+def calc_fees(w3: Web3, blk=None):
+    if blk is None:
+        blk = w3.eth.get_block("latest")
     base = blk.get("baseFeePerGas", 0) or 0
     prio = int(PRIO_FEE_GWEI * 1e9)
     max_fee = int(base * 2 + prio)
@@ -55,39 +74,109 @@ def calc_fees(w3: Web3):
 
 def gwei(n): return float(n) / 1e9
 
+# "name()" -> 0x-prefixed 4-byte selector; zero-arg calldata is just the selector
+SELECTOR_CACHE = {}
+
+def selector(signature: str) -> str:
+    sel = SELECTOR_CACHE.get(signature)
+    if sel is None:
+        sel = SELECTOR_CACHE[signature] = Web3.to_hex(Web3.keccak(text=signature)[:4])
+    return sel
+
+class RPCError(Exception):
+    """Error object a JSON-RPC batch returned for one of its calls."""
+
+def batch_preflight(w3: Web3, txs: list):
+    """
+    One raw JSON-RPC batch for the latest block, our nonce and an eth_estimateGas per tx.
+    Returns (block, nonce, estimates); an estimate is an int, or the exception if it failed.
+    Responses are matched by id, so a reverting estimate only fails its own row; only a
+    refused batch falls back to one request per call.
+    """
+    calls = [("eth_getBlockByNumber", ["latest", False]), ("eth_getTransactionCount", [from_addr, "latest"])]
+    calls += [("eth_estimateGas", [tx]) for tx in txs]
+    body = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    try:
+        r = http_client().post(RPC, json=body, timeout=30)
+        r.raise_for_status()
+        data = fastjson.loads(r.content)
+    except HTTP_ERRORS + (ValueError,):
+        data = None
+    if isinstance(data, list):
+        by_id = {d.get("id"): d for d in data if isinstance(d, dict)}
+        res = [by_id.get(i, {"error": {"message": "missing_response"}}) for i in range(len(calls))]
+        blk, count = res[0].get("result"), res[1].get("result")
+        if blk and count is not None:
+            ests = [int(d["result"], 16) if d.get("result") is not None
+                    else RPCError((d.get("error") or {}).get("message", "no result")) for d in res[2:]]
+            return {"baseFeePerGas": int(blk.get("baseFeePerGas") or "0x0", 16)}, int(count, 16), ests
+    # Batch refused (single error object / HTTP error): one request per call
+    ests = []
+    for tx in txs:
+        try:
+            ests.append(w3.eth.estimate_gas(tx))
+        except Exception as e:
+            ests.append(e)
+    return w3.eth.get_block("latest"), w3.eth.get_transaction_count(from_addr), ests
+
 # CSV logger
 CSV_HEADERS = ["timestamp","address","function","gas_estimate","gas_limit",
                "base_fee_gwei","priority_fee_gwei","max_fee_gwei",
                "sent","tx_hash","status"]
 
+_csv_log = None  # (file, DictWriter), opened once on the first attempt
+
 def csv_log_row(row: dict):
-    path = Path(LOG_FILE_CSV)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    write_header = not path.exists()
-    with open(path, "a", newline="") as f:
+    global _csv_log
+    if _csv_log is None:
+        path = Path(LOG_FILE_CSV)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not path.exists()
+        f = open(path, "a", newline="")
         w = csv.DictWriter(f, fieldnames=CSV_HEADERS)
         if write_header:
             w.writeheader()
-        w.writerow({k: row.get(k, "") for k in CSV_HEADERS})
-
-# Tried set from previous runs
-tried = set()
+        _csv_log = (f, w)
+    f, w = _csv_log
+    w.writerow({k: row.get(k, "") for k in CSV_HEADERS})
+    if row.get("sent"):
+        f.flush()  # keep the record of a sent tx even if the run dies afterwards
+
+def csv_log_close():
+    global _csv_log
+    if _csv_log is not None:
+        _csv_log[0].close()
+        _csv_log = None
+
+def log_sent(attempt: dict, entry: dict):
+    """CSV row + JSONL entry for a broadcast tx, flushed at once so a later crash can't lose it."""
+    csv_log_row(attempt)
+    path = Path(LOG_FILE_JSONL)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(fastjson.dumps(entry) + "\n")
+
+def attempt_keys(addrs: pd.Series, fns: pd.Series) -> np.ndarray:
+    """64-bit hash of (lower-case address, function without trailing "()") per row."""
+    norm = pd.DataFrame({
+        "a": addrs.astype("string").str.lower(),
+        "f": fns.astype("string").str.strip().str.removesuffix("()"),
+    })
+    return pd.util.hash_pandas_object(norm, index=False, categorize=False).to_numpy()
+
+# Tried (address, function) pairs from previous runs
+tried_keys = np.empty(0, dtype=np.uint64)
 log_path = Path(LOG_FILE_CSV)
 if log_path.exists():
     try:
-        prev = pd.read_csv(log_path)
+        prev = pd.read_csv(log_path, usecols=lambda c: c in LOG_DTYPES, dtype=LOG_DTYPES)
         if {"address","function"}.issubset(prev.columns):
-            # normalize function by stripping trailing "()"
-            for a, f in zip(prev["address"].astype(str), prev["function"].astype(str)):
-                fn = f.strip()
-                if fn.endswith("()"): fn = fn[:-2]
-                tried.add((a.lower(), fn))
+            tried_keys = np.unique(attempt_keys(prev["address"], prev["function"]))
     except Exception:
-        tried = set()
-
+        tried_keys = np.empty(0, dtype=np.uint64)
 
 # Load base candidates
-df = pd.read_csv(CALL_RESULTS_CSV)
+df = pd.read_csv(CALL_RESULTS_CSV, usecols=lambda c: c in CALL_RESULTS_DTYPES, dtype=CALL_RESULTS_DTYPES)
 
 # Verbose: explain why rows are filtered out (preview only)
 if bool(int(os.getenv("VERBOSE_FILTER","1"))):
@@ -96,14 +185,22 @@ if bool(int(os.getenv("VERBOSE_FILTER","1"))):
     print(f"[sender] Base candidates after filters: {len(base_ok)}/{total}")
 
 
-filt = (df["CallOK"] == True) & (df["EstimateOK"] == True)
+# Normalize the filter columns once, then evaluate all conditions as one
+# expression (pandas uses numexpr for it when installed)
+conds = ["CallOK", "EstimateOK"]
+for col in ("CallOK", "EstimateOK"):
+    df[col] = df[col].fillna(False).astype(bool)
 if "ABIInputs" in df.columns:
-    filt &= df["ABIInputs"].fillna(-1).astype(int).isin([0,1])
+    df["ABIInputs"] = df["ABIInputs"].to_numpy(dtype=np.int16, na_value=-1)
+    conds.append("(ABIInputs == 0 or ABIInputs == 1)")
 if "Mutability" in df.columns:
-    filt &= ~df["Mutability"].astype(str).str.lower().isin(["view","pure"])
+    df["Mutability"] = df["Mutability"].astype("string").str.lower()
+    conds.append("Mutability not in ['view', 'pure']")
 if "Balance (ETH)" in df.columns:
-    filt &= df["Balance (ETH)"].fillna(0) >= MIN_BAL_ETH
-filt &= df["Function"].notna() & ~df["Function"].astype(str).str.contains(r"\(")  # zero-arg by name
+    df["Balance (ETH)"] = df["Balance (ETH)"].fillna(0)
+    conds.append("`Balance (ETH)` >= @MIN_BAL_ETH")
+filt = df.eval(" and ".join(conds))
+filt &= ~df["Function"].str.contains("(", regex=False, na=True).to_numpy(dtype=bool)  # zero-arg by name
 
 candidates = df[filt][["Address","Function","GasEstimate"]].drop_duplicates()
 
@@ -113,20 +210,52 @@ BLOCKLIST_PATTERNS = [
     r"^set[A-Z_]", r"^upgrade", r"^pause", r"^unpause", r"^rescue", r"^emergency",
     r"control", r"transferOwnership", r"withdrawControl"
 ]
+BLOCKLIST_RE = re.compile("|".join(BLOCKLIST_PATTERNS), re.IGNORECASE)
+# The same blocklist as lower-case literals for the automaton: (term, anchored at the start of the name)
+BLOCKLIST_TERMS = (
+    [(t, True) for t in ("owner", "admin", "govern", "manager", "operator",
+                         "upgrade", "pause", "unpause", "rescue", "emergency")]
+    + [("set" + c, True) for c in "abcdefghijklmnopqrstuvwxyz_"]
+    + [(t, False) for t in ("control", "transferownership", "withdrawcontrol")]
+)
+
+def build_blocklist_automaton(terms):
+    A = ahocorasick.Automaton()
+    for term, anchored in terms:
+        A.add_word(term, (term, anchored))
+    A.make_automaton()
+    return A
+
+def is_blocked(A, name: str) -> bool:
+    for end, (term, anchored) in A.iter(name.lower()):
+        if not anchored or end == len(term) - 1:
+            return True
+    return False
+
 if not ALLOW_ADMINY:
-    regex = re.compile("|".join(BLOCKLIST_PATTERNS), re.IGNORECASE)
-    candidates = candidates[~candidates["Function"].astype(str).str.contains(regex)]
+    # Check each distinct name once, then broadcast back through the category codes
+    fn_cat = candidates["Function"].astype("category").cat
+    if ahocorasick is not None:
+        BLOCKLIST_AUTOMATON = build_blocklist_automaton(BLOCKLIST_TERMS)
+        blocked = np.fromiter((is_blocked(BLOCKLIST_AUTOMATON, str(n)) for n in fn_cat.categories),
+                              dtype=bool, count=len(fn_cat.categories))
+    else:
+        blocked = pd.Series(fn_cat.categories, dtype="string").str.contains(BLOCKLIST_RE, na=False).to_numpy(dtype=bool)
+    codes = fn_cat.codes.to_numpy()
+    candidates = candidates[~(blocked[codes] & (codes >= 0))]
 
 # Merge preflight claimables if available
 pf = None
 if Path(PREFLIGHT_CSV).exists():
-    pf = pd.read_csv(PREFLIGHT_CSV)
+    pf = pd.read_csv(PREFLIGHT_CSV, usecols=["Address","Function","RawValue","AsEther"], dtype=PREFLIGHT_DTYPES)
     # coerce numbers
     for col in ("RawValue","AsEther"):
         if col in pf.columns:
             pf[col] = pd.to_numeric(pf[col], errors="coerce").fillna(0)
-    # prefer positives
-    pf_pos = pf[pf["RawValue"] > 0][["Address","Function","RawValue","AsEther"]].drop_duplicates(["Address","Function"])
+    # prefer positives; keep the largest value per (Address, Function)
+    pf_pos = (pf.loc[pf["RawValue"] > 0, ["Address","Function","RawValue","AsEther"]]
+              .sort_values("RawValue", ascending=False)
+              .drop_duplicates(["Address","Function"], keep="first"))
     candidates = candidates.merge(pf_pos, on=["Address","Function"], how="left")
 else:
     candidates["RawValue"] = 0.0
@@ -141,10 +270,9 @@ if "GasEstimate" in candidates.columns:
     candidates = candidates.sort_values(["RawValue","GasEstimate"], ascending=[False, True])
 
 # Apply skip-tried unless FORCE
-if not FORCE and len(tried) > 0:
-    mask_list = [ (str(a).lower(), str(f).strip()) not in tried for a, f in zip(candidates["Address"], candidates["Function"]) ]
-    mask = pd.Series(mask_list, index=candidates.index)
-    candidates = candidates[mask]
+if not FORCE and tried_keys.size > 0:
+    seen = np.isin(attempt_keys(candidates["Address"], candidates["Function"]), tried_keys)
+    candidates = candidates[~seen]
 
 candidates = candidates.head(MAX_TX)
 
@@ -157,51 +285,52 @@ if candidates.empty:
 print("— Candidates —")
 print(candidates.to_string(index=False))
 
-# Build & possibly send
-nonce = w3.eth.get_transaction_count(from_addr)
-sent = 0
-logs_json = []
+# Connect only once there is something to send (no-op runs make no RPC calls)
+w3 = Web3(Web3.HTTPProvider(RPC, request_kwargs={"timeout": 30}))
+assert w3.is_connected(), f"Cannot connect to RPC {RPC}"
 
-for _, row in candidates.iterrows():
-    to_addr = Web3.to_checksum_address(str(row["Address"]).strip())
-    fn_name = str(row["Function"]).strip()
-    raw_val = float(row.get("RawValue", 0) or 0)
-    as_eth = float(row.get("AsEther", 0) or 0)
+# Build calldata for every candidate, then fetch fees, nonce and gas estimates in one round trip
+prepared = []
+addrs = [Web3.to_checksum_address(str(a).strip()) for a in candidates["Address"].to_numpy()]
+fns = [str(f).strip() for f in candidates["Function"].to_numpy()]
+raws = candidates["RawValue"].fillna(0).to_numpy(dtype=float)
+eths = candidates["AsEther"].fillna(0).to_numpy(dtype=float)
+for to_addr, fn_name, raw_val, as_eth in zip(addrs, fns, raws, eths):
+    raw_val, as_eth = float(raw_val), float(as_eth)
     if REQUIRE_POSITIVE and raw_val <= 0:
         print(f"Skipping {to_addr} {fn_name}(): claimable<=0")
         continue
 
-    # Minimal ABI stub for zero-arg call
-    abi = [{
-        "name": fn_name,
-        "type": "function",
-        "stateMutability": "nonpayable",
-        "inputs": [],
-        "outputs": []
-    }]
-    contract = w3.eth.contract(address=to_addr, abi=abi)
-    fn = contract.get_function_by_signature(f"{fn_name}()")()
-
-    # re-estimate
-    try:
-        est = w3.eth.estimate_gas({"from": from_addr, "to": to_addr, "data": fn._encode_transaction_data()})
-    except Exception as e:
-        print(f"❌ estimate_gas failed for {to_addr} {fn_name}(): {e.__class__.__name__}")
+    prepared.append((to_addr, fn_name, as_eth, selector(f"{fn_name}()")))
+
+blk, nonce, estimates = batch_preflight(
+    w3, [{"from": from_addr, "to": to_addr, "data": data} for to_addr, _, _, data in prepared])
+# Fees come from the batched block; sends go out back to back, receipts are awaited afterwards
+base, prio, max_fee = calc_fees(w3, blk)
+chain_id = w3.eth.chain_id
+sent = 0
+logs_json = []
+pool = ThreadPoolExecutor(max_workers=max(1, RPC_WORKERS))
+pending = []  # (receipt future, tx, attempt, tx hash) for sent txs, in nonce order
+
+for (to_addr, fn_name, as_eth, data), est in zip(prepared, estimates):
+    # re-estimate (batched above)
+    if isinstance(est, Exception):
+        print(f"❌ estimate_gas failed for {to_addr} {fn_name}(): {est.__class__.__name__}")
         continue
 
     gas_limit = int(min(GAS_CAP, math.ceil(est * GAS_BUMP)))
-    base, prio, max_fee = calc_fees(w3)
 
     tx = {
         "from": from_addr,
         "to": to_addr,
         "nonce": nonce,
-        "data": fn._encode_transaction_data(),
+        "data": data,
         "value": 0,
         "gas": gas_limit,
         "maxPriorityFeePerGas": prio,
         "maxFeePerGas": max_fee,
-        "chainId": w3.eth.chain_id,
+        "chainId": chain_id,
     }
 
     print(f"→ Prepared tx #{sent+1}: to={to_addr} fn={fn_name}() claimable≈{as_eth if as_eth else 0} "
@@ -232,15 +361,13 @@ for _, row in candidates.iterrows():
             print(f"   ✓ Sent: {h}")
             print(f"   🔗 Etherscan: https://etherscan.io/tx/{h}")
             nonce += 1
-            status = "SENT"
-            if os.getenv("WAIT_FOR_RECEIPT", "1") == "1":
-                rcpt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-                status = f"MINED:{rcpt.status}"
-                print(f"   ✓ Receipt status={rcpt.status} gasUsed={rcpt.gasUsed}")
-            logs_json.append({**tx, "txHash": h, "status": status})
-            attempt.update({"sent": 1, "tx_hash": h, "status": status})
-            csv_log_row(attempt)
             sent += 1
+            attempt.update({"sent": 1, "tx_hash": h, "status": "SENT"})
+            log_sent(attempt, {**tx, "txHash": h, "status": "SENT"})
+            # Optional wait, overlapped with the remaining sends
+            if WAIT_FOR_RECEIPT:
+                pending.append((pool.submit(w3.eth.wait_for_transaction_receipt, tx_hash, timeout=120),
+                                tx, attempt, h))
         except Exception as e:
             err = f"SEND_FAIL:{e.__class__.__name__}"
             print(f"   ✗ Send failed: {e.__class__.__name__}: {e}")
@@ -251,10 +378,24 @@ for _, row in candidates.iterrows():
     if sent >= MAX_TX:
         break
 
+for fut, tx, attempt, h in pending:
+    try:
+        rcpt = fut.result()
+        status = f"MINED:{rcpt.status}"
+        print(f"   ✓ Receipt {h} status={rcpt.status} gasUsed={rcpt.gasUsed}")
+    except Exception as e:
+        status = f"RECEIPT_FAIL:{e.__class__.__name__}"
+        print(f"   ✗ Receipt wait failed for {h}: {e.__class__.__name__}: {e}")
+    # second row for the same tx: its final status
+    attempt.update({"timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"), "status": status})
+    log_sent(attempt, {**tx, "txHash": h, "status": status})
+pool.shutdown()
+
+csv_log_close()
+
 # JSONL log (append)
 Path(LOG_FILE_JSONL).parent.mkdir(parents=True, exist_ok=True)
 with open(LOG_FILE_JSONL, "a") as f:
-    for entry in logs_json:
-        f.write(json.dumps(entry) + "\n")
+    f.write("".join(fastjson.dumps(entry) + "\n" for entry in logs_json))
 
 print(f"🏁 Done. Sent={sent} | Log (jsonl) → {LOG_FILE_JSONL} | Log (csv) → {LOG_FILE_CSV}")
\ No newline at end of file
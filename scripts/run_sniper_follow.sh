@@ -10,6 +10,7 @@ if [ -d "venv" ]; then source "venv/bin/activate"; fi
 export DUST_MIN="${DUST_MIN:-1e-5}"
 export DUST_MAX="${DUST_MAX:-0.01}"
 export WORKERS="${WORKERS:-8}"
+export RPC_BATCH="${RPC_BATCH:-10}"
 export FOLLOW=1
 export LOG_EVERY="${LOG_EVERY:-10}"
 
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 import os, re, json, math
+import numpy as np
 import pandas as pd
 from web3 import Web3
 
+# pyahocorasick finds allow and deny keywords in one pass per name; without it fall back to the regex
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,8 +23,27 @@ PRIO_FEE_GWEI = float(os.getenv("PRIO_FEE_GWEI", "1.5"))
 GAS_CAP = int(os.getenv("GAS_CAP", "60000"))
 ENABLE_SEND = bool(int(os.getenv("ENABLE_SEND", "0")))
 
-ALLOW_RE = re.compile(r"claim|getReward|withdraw|harvest|collect|release|redeem|payout|unstake|exit", re.I)
-DENY_RE = re.compile(r"approve|set|owner|upgrade|pause|mint|burn|migrate|batch|initialize|permit|deposit|wrap|unwrap|transfer|tax|fee|fund|treasury|marketing|rewardpool|dividend|reflection|distribute", re.I)
+ALLOW_SRC = r"claim|getReward|withdraw|harvest|collect|release|redeem|payout|unstake|exit"
+DENY_SRC = r"approve|set|owner|upgrade|pause|mint|burn|migrate|batch|initialize|permit|deposit|wrap|unwrap|transfer|tax|fee|fund|treasury|marketing|rewardpool|dividend|reflection|distribute"
+# Allowed anywhere in the name and denied nowhere, checked in a single regex pass
+STRICT_RE = re.compile(rf"(?=.*(?:{ALLOW_SRC}))(?!.*(?:{DENY_SRC}))", re.I | re.S)
+
+def build_strict_automaton():
+    A = ahocorasick.Automaton()
+    for tag, src in (("allow", ALLOW_SRC), ("deny", DENY_SRC)):
+        for kw in src.lower().split("|"):
+            A.add_word(kw, tag)
+    A.make_automaton()
+    return A
+
+def strict_match(A, name: str) -> bool:
+    """Some allow keyword and no deny keyword anywhere in the name (same as STRICT_RE)."""
+    allowed = False
+    for _, tag in A.iter(name.lower()):
+        if tag == "deny":
+            return False
+        allowed = True
+    return allowed
 
 rpc_url = os.getenv("RPC")
 if not rpc_url:
@@ -34,7 +60,16 @@ df = pd.read_csv(candidates_file)
 total_before = len(df)
 
 # Apply filters
-filt = df["Function"].str.match(ALLOW_RE) & ~df["Function"].str.match(DENY_RE)
+if ahocorasick is not None:
+    # Scan each distinct name once, then broadcast back through the category codes
+    fn_cat = df["Function"].astype("category").cat
+    A = build_strict_automaton()
+    keep = np.fromiter((strict_match(A, str(n)) for n in fn_cat.categories),
+                       dtype=bool, count=len(fn_cat.categories))
+    keep = np.append(keep, False)  # code -1 (missing name) lands on this trailing False
+    filt = pd.Series(keep[fn_cat.codes.to_numpy()], index=df.index)
+else:
+    filt = df["Function"].str.match(STRICT_RE, na=False)
 if REQUIRE_POSITIVE:
     filt &= (df["AsEther"].fillna(0) > MIN_AS_ETHER)
 
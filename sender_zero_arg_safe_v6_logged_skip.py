@@ -1,14 +1,25 @@
 import os
 import math
 import csv
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from web3 import Web3
 
+try:
+    import orjson
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json
+
+    json_dumps = json.dumps
+
 # ------------- Config -------------
 CALL_RESULTS_CSV = os.getenv("CALL_RESULTS_CSV", "results/call_builder_results.csv")
 LOG_FILE_JSONL = os.getenv("SENDER_LOG", "results/sender_log.txt")
@@ -19,6 +30,16 @@ ENABLE_SEND = os.getenv("ENABLE_SEND", "0") == "1"
 MAX_TX = int(os.getenv("MAX_TX", "1"))
 MIN_BAL_ETH = float(os.getenv("MIN_BAL_ETH", "0.0"))   # shortlist already filters usually
 FORCE = os.getenv("FORCE", "0") == "1"                 # override skip logic
+WAIT_FOR_RECEIPT = os.getenv("WAIT_FOR_RECEIPT", "1") == "1"
+RPC_WORKERS = int(os.getenv("RPC_WORKERS", "8"))        # concurrent estimate/receipt RPCs
+
+# Only the columns the filters use, with compact dtypes (any of them may be absent)
+CALL_RESULTS_DTYPES = {
+    "Address": "string", "Function": "string", "GasEstimate": "Int64",
+    "CallOK": "boolean", "EstimateOK": "boolean", "ABIInputs": "Int16",
+    "Mutability": "category", "Balance (ETH)": "float64",
+}
+LOG_DTYPES = {"address": "string", "function": "string"}
 
 # Gas & fees
 GAS_BUMP = float(os.getenv("GAS_BUMP", "1.15"))
@@ -38,8 +59,6 @@ if not FROM_ADDRESS:
 if ENABLE_SEND and not PRIVATE_KEY:
     raise SystemExit("❌ ENABLE_SEND=1 but no PRIVATE_KEY in .env")
 
-w3 = Web3(Web3.HTTPProvider(RPC, request_kwargs={"timeout": 30}))
-assert w3.is_connected(), f"Cannot connect to RPC {RPC}"
 from_addr = Web3.to_checksum_address(FROM_ADDRESS)
 
 def calc_fees(w3: Web3):
@@ -51,44 +70,91 @@ def calc_fees(w3: Web3):
 
 def gwei(n): return float(n) / 1e9
 
+# "name()" -> 0x-prefixed 4-byte selector; zero-arg calldata is just the selector
+SELECTOR_CACHE = {}
+
+def selector(signature: str) -> str:
+    sel = SELECTOR_CACHE.get(signature)
+    if sel is None:
+        sel = SELECTOR_CACHE[signature] = Web3.to_hex(Web3.keccak(text=signature)[:4])
+    return sel
+
 # ------------- CSV logger -------------
 CSV_HEADERS = ["timestamp","address","function","gas_estimate","gas_limit",
                "base_fee_gwei","priority_fee_gwei","max_fee_gwei",
                "sent","tx_hash","status"]
 
+_csv_log = None  # (file, DictWriter), opened once on the first attempt
+
 def csv_log_row(row: dict):
-    path = Path(LOG_FILE_CSV)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    write_header = not path.exists()
-    with open(path, "a", newline="") as f:
+    global _csv_log
+    if _csv_log is None:
+        path = Path(LOG_FILE_CSV)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not path.exists()
+        f = open(path, "a", newline="")
         w = csv.DictWriter(f, fieldnames=CSV_HEADERS)
         if write_header:
             w.writeheader()
-        w.writerow({k: row.get(k, "") for k in CSV_HEADERS})
+        _csv_log = (f, w)
+    f, w = _csv_log
+    w.writerow({k: row.get(k, "") for k in CSV_HEADERS})
+    if row.get("sent"):
+        f.flush()  # keep the record of a sent tx even if the run dies afterwards
+
+def csv_log_close():
+    global _csv_log
+    if _csv_log is not None:
+        _csv_log[0].close()
+        _csv_log = None
+
+def log_sent(attempt: dict, entry: dict):
+    """CSV row + JSONL entry for a broadcast tx, flushed at once so a later crash can't lose it."""
+    csv_log_row(attempt)
+    path = Path(LOG_FILE_JSONL)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json_dumps(entry) + "\n")
+
+def attempt_keys(addrs: pd.Series, fns: pd.Series) -> np.ndarray:
+    """64-bit hash of (lower-case address, function without trailing "()") per row."""
+    norm = pd.DataFrame({
+        "a": addrs.astype("string").str.lower(),
+        "f": fns.astype("string").str.strip().str.removesuffix("()"),
+    })
+    return pd.util.hash_pandas_object(norm, index=False, categorize=False).to_numpy()
 
 # ------------- Load tried set -------------
-tried = set()
+tried_keys = np.empty(0, dtype=np.uint64)
 log_path = Path(LOG_FILE_CSV)
 if log_path.exists():
     try:
-        prev = pd.read_csv(log_path)
+        prev = pd.read_csv(log_path, usecols=lambda c: c in LOG_DTYPES, dtype=LOG_DTYPES)
         if {"address","function"}.issubset(prev.columns):
-            tried = {(a.lower(), f) for a, f in zip(prev["address"].astype(str), prev["function"].astype(str))}
+            tried_keys = np.unique(attempt_keys(prev["address"], prev["function"]))
     except Exception:
-        tried = set()
+        tried_keys = np.empty(0, dtype=np.uint64)
 
 # ------------- Load & filter candidates -------------
-df = pd.read_csv(CALL_RESULTS_CSV)
+df = pd.read_csv(CALL_RESULTS_CSV, usecols=lambda c: c in CALL_RESULTS_DTYPES, dtype=CALL_RESULTS_DTYPES)
 
 # Basic safety filters
-filt = (df["CallOK"] == True) & (df["EstimateOK"] == True)
+# Normalize the filter columns once, then evaluate all conditions as one
+# expression (pandas uses numexpr for it when installed)
+conds = ["CallOK", "EstimateOK"]
+for col in ("CallOK", "EstimateOK"):
+    df[col] = df[col].fillna(False).astype(bool)
 if "ABIInputs" in df.columns:
-    filt &= df["ABIInputs"].fillna(-1).astype(int).eq(0)
+    df["ABIInputs"] = df["ABIInputs"].to_numpy(dtype=np.int16, na_value=-1)
+    conds.append("ABIInputs == 0")
 if "Mutability" in df.columns:
-    filt &= ~df["Mutability"].astype(str).str.lower().isin(["view","pure"])
+    df["Mutability"] = df["Mutability"].astype("string").str.lower()
+    conds.append("Mutability not in ['view', 'pure']")
 if "Balance (ETH)" in df.columns:
-    filt &= df["Balance (ETH)"].fillna(0) >= MIN_BAL_ETH
-filt &= df["Function"].notna() & ~df["Function"].astype(str).str.contains(r"\(")  # zero-arg by name
+    df["Balance (ETH)"] = df["Balance (ETH)"].fillna(0)
+    conds.append("`Balance (ETH)` >= @MIN_BAL_ETH")
+filt = df.eval(" and ".join(conds))
+filt &= ~df["Function"].str.contains("(", regex=False, na=True).to_numpy(dtype=bool)  # zero-arg by name
 
 candidates = df[filt].copy()
 # Prefer lower gas first
@@ -96,9 +162,9 @@ if "GasEstimate" in candidates.columns:
     candidates = candidates.sort_values("GasEstimate")
 
 # Apply skip unless FORCE=1
-if not FORCE and len(tried) > 0:
-    m = ~[( (str(a).lower(), str(f)) in tried ) for a, f in zip(candidates["Address"], candidates["Function"])]
-    candidates = candidates[m]
+if not FORCE and tried_keys.size > 0:
+    seen = np.isin(attempt_keys(candidates["Address"], candidates["Function"]), tried_keys)
+    candidates = candidates[~seen]
 
 candidates = candidates.head(MAX_TX)
 
@@ -109,45 +175,49 @@ if candidates.empty:
     raise SystemExit(0)
 
 # ------------- Build & (optionally) send -------------
+# Connect only once there is something to send (no-op runs make no RPC calls)
+w3 = Web3(Web3.HTTPProvider(RPC, request_kwargs={"timeout": 30}))
+assert w3.is_connected(), f"Cannot connect to RPC {RPC}"
 nonce = w3.eth.get_transaction_count(from_addr)
+# Fees and chain id once per run; sends go out back to back, receipts are awaited afterwards
+base, prio, max_fee = calc_fees(w3)
+chain_id = w3.eth.chain_id
 sent = 0
 logs_json = []
 
-for _, row in candidates.iterrows():
-    to_addr = Web3.to_checksum_address(str(row["Address"]).strip())
-    fn_name = str(row["Function"]).strip()
-
-    # Minimal ABI for zero-arg function by name
-    abi = [{
-        "name": fn_name,
-        "type": "function",
-        "stateMutability": "nonpayable",
-        "inputs": [],
-        "outputs": []
-    }]
-    contract = w3.eth.contract(address=to_addr, abi=abi)
-    fn = contract.get_function_by_signature(f"{fn_name}()")()
-
-    # Re-estimate on-chain
+addrs = [Web3.to_checksum_address(str(a).strip()) for a in candidates["Address"].to_numpy()]
+fns = [str(f).strip() for f in candidates["Function"].to_numpy()]
+datas = [selector(f"{fn_name}()") for fn_name in fns]
+
+def estimate(to_addr, data):
+    """estimate_gas for one call; returns the exception instead of raising."""
     try:
-        est = w3.eth.estimate_gas({"from": from_addr, "to": to_addr, "data": fn._encode_transaction_data()})
+        return w3.eth.estimate_gas({"from": from_addr, "to": to_addr, "data": data})
     except Exception as e:
-        print(f"❌ estimate_gas failed for {to_addr} {fn_name}(): {e.__class__.__name__}")
+        return e
+
+pool = ThreadPoolExecutor(max_workers=max(1, RPC_WORKERS))
+# Re-estimate on-chain, all candidates concurrently
+estimates = list(pool.map(estimate, addrs, datas))
+pending = []  # (receipt future, tx, attempt, tx hash) for sent txs, in nonce order
+
+for to_addr, fn_name, data, est in zip(addrs, fns, datas, estimates):
+    if isinstance(est, Exception):
+        print(f"❌ estimate_gas failed for {to_addr} {fn_name}(): {est.__class__.__name__}")
         continue
 
     gas_limit = int(min(GAS_CAP, math.ceil(est * GAS_BUMP)))
-    base, prio, max_fee = calc_fees(w3)
 
     tx = {
         "from": from_addr,
         "to": to_addr,
         "nonce": nonce,
-        "data": fn._encode_transaction_data(),
+        "data": data,
         "value": 0,
         "gas": gas_limit,
         "maxPriorityFeePerGas": prio,
         "maxFeePerGas": max_fee,
-        "chainId": w3.eth.chain_id,
+        "chainId": chain_id,
     }
 
     print(f"→ Prepared tx #{sent+1}: to={to_addr} fn={fn_name}() gas~{est} -> limit {gas_limit} "
@@ -178,18 +248,14 @@ for _, row in candidates.iterrows():
             print(f"   ✓ Sent: {h}")
             print(f"   🔗 Etherscan: https://etherscan.io/tx/{h}")
             nonce += 1
-            status = "SENT"
-
-            # Optional wait
-            if os.getenv("WAIT_FOR_RECEIPT", "1") == "1":
-                rcpt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-                status = f"MINED:{rcpt.status}"
-                print(f"   ✓ Receipt status={rcpt.status} gasUsed={rcpt.gasUsed}")
-
-            logs_json.append({**tx, "txHash": h, "status": status})
-            attempt.update({"sent": 1, "tx_hash": h, "status": status})
-            csv_log_row(attempt)
             sent += 1
+            attempt.update({"sent": 1, "tx_hash": h, "status": "SENT"})
+            log_sent(attempt, {**tx, "txHash": h, "status": "SENT"})
+
+            # Optional wait, overlapped with the remaining sends
+            if WAIT_FOR_RECEIPT:
+                pending.append((pool.submit(w3.eth.wait_for_transaction_receipt, tx_hash, timeout=120),
+                                tx, attempt, h))
         except Exception as e:
             err = f"SEND_FAIL:{e.__class__.__name__}"
             print(f"   ✗ Send failed: {e.__class__.__name__}: {e}")
@@ -200,10 +266,24 @@ for _, row in candidates.iterrows():
     if sent >= MAX_TX:
         break
 
+for fut, tx, attempt, h in pending:
+    try:
+        rcpt = fut.result()
+        status = f"MINED:{rcpt.status}"
+        print(f"   ✓ Receipt {h} status={rcpt.status} gasUsed={rcpt.gasUsed}")
+    except Exception as e:
+        status = f"RECEIPT_FAIL:{e.__class__.__name__}"
+        print(f"   ✗ Receipt wait failed for {h}: {e.__class__.__name__}: {e}")
+    # second row for the same tx: its final status
+    attempt.update({"timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"), "status": status})
+    log_sent(attempt, {**tx, "txHash": h, "status": status})
+pool.shutdown()
+
+csv_log_close()
+
 # JSONL log (append)
 Path(LOG_FILE_JSONL).parent.mkdir(parents=True, exist_ok=True)
 with open(LOG_FILE_JSONL, "a") as f:
-    for entry in logs_json:
-        f.write(json.dumps(entry) + "\n")
+    f.write("".join(json_dumps(entry) + "\n" for entry in logs_json))
 
 print(f"🏁 Done. Sent={sent} | Log (jsonl) → {LOG_FILE_JSONL} | Log (csv) → {LOG_FILE_CSV}")
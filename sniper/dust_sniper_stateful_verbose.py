@@ -1,10 +1,32 @@
 
 #!/usr/bin/env python3
-import asyncio, aiohttp, csv, os, sys, time, math
+import asyncio, aiohttp, atexit, heapq, os, sys, time
+from decimal import Decimal
 from pathlib import Path
+import numpy as np
 from web3 import Web3
 from dotenv import load_dotenv
 
+# orjson (Rust parser) for the large block bodies when installed, stdlib json otherwise
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json
+
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+# numba compiles the dust band scan when installed; otherwise NumPy masks do it
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 load_dotenv()
 
 # Paths
@@ -22,8 +44,16 @@ DUST_MIN = float(os.getenv("DUST_MIN", "1e-5"))
 DUST_MAX = float(os.getenv("DUST_MAX", "0.01"))
 WORKERS   = int(os.getenv("WORKERS", "8"))
 FOLLOW    = int(os.getenv("FOLLOW", "0"))  # 1 = keep tailing new blocks
-BATCH     = max(WORKERS, 8)                # batch size equals workers
+RPC_BATCH = max(1, int(os.getenv("RPC_BATCH", "10")))  # blocks per JSON-RPC batch request
+PROBE_EMPTY = os.getenv("PROBE_EMPTY", "0") == "1"     # 1 = tx-count probe first, skip empty blocks (quiet chains)
+# Dust band in wei, so the per-tx check is a plain integer compare
+# (clamped to uint64 for the vectorized filter; larger values can never be dust)
+U64_MAX = 2**64 - 1
+WEI_MIN = min(int(Decimal(repr(DUST_MIN)) * 10**18), U64_MAX)
+WEI_MAX = min(int(Decimal(repr(DUST_MAX)) * 10**18), U64_MAX)
 LOG_EVERY = int(os.getenv("LOG_EVERY", "10"))  # batches between progress logs
+FOLLOW_MIN_SLEEP = 1.0                     # follow-mode poll interval after a new head (s)
+FOLLOW_MAX_SLEEP = 12.0                    # ... backing off to about one block time
 
 w3 = Web3(Web3.HTTPProvider(RPC_URL))
 
@@ -41,43 +71,137 @@ def write_last_block(n: int):
     STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
     STATE_FILE.write_text(str(n), encoding="utf-8")
 
+# Newest fully written block not yet persisted; the state file is only rewritten every
+# few batches, and at exit (including Ctrl-C) so no finished progress is lost
+_unsaved_last_block = None
+
+def note_last_block(n: int):
+    global _unsaved_last_block
+    _unsaved_last_block = n
+
+def flush_last_block():
+    global _unsaved_last_block
+    if _unsaved_last_block is not None:
+        write_last_block(_unsaved_last_block)
+        _unsaved_last_block = None
+
+atexit.register(flush_last_block)
+
 async def fetch_block(session, bn: int):
+    """One eth_getBlockByNumber. Raises instead of returning None: every block scanned is at or
+    below the head, so a missing result is an RPC failure, never an empty block."""
     payload = {"jsonrpc":"2.0","method":"eth_getBlockByNumber","params":[hex(bn), True],"id":bn}
     async with session.post(RPC_URL, json=payload, timeout=90) as resp:
-        data = await resp.json()
-        return data.get("result")
+        data = json_loads(await resp.read())
+    blk = data.get("result") if isinstance(data, dict) else None
+    if blk is None:
+        err = data.get("error") if isinstance(data, dict) else data
+        raise RuntimeError(f"block {bn}: no result from RPC ({err})")
+    return blk
+
+async def fetch_head(session) -> int:
+    """eth_blockNumber over the shared session (no blocking web3 call inside the event loop)."""
+    payload = {"jsonrpc":"2.0","method":"eth_blockNumber","params":[],"id":0}
+    async with session.post(RPC_URL, json=payload, timeout=30) as resp:
+        data = json_loads(await resp.read())
+    return int(data["result"], 16)
+
+async def rpc_batch(session, method: str, bns, params):
+    """One JSON-RPC batch POST calling method for every block in bns (id = block number).
+    Returns results in bns order (None for an item that errored or is missing),
+    or None when the provider rejects batch requests."""
+    payload = [{"jsonrpc":"2.0","method":method,"params":params(bn),"id":bn} for bn in bns]
+    async with session.post(RPC_URL, json=payload, timeout=90) as resp:
+        data = json_loads(await resp.read())
+    if not isinstance(data, list):
+        return None
+    by_id = {item.get("id"): item.get("result") for item in data
+             if isinstance(item, dict) and "error" not in item}
+    return [by_id.get(bn) for bn in bns]
+
+async def fetch_blocks(session, bns):
+    """eth_getBlockByNumber for every block in bns as one JSON-RPC batch; results in bns order.
+    Blocks the batch did not return are refetched alone (raising if that fails too), so a
+    failed item is never mistaken for an empty block and skipped past."""
+    bns = list(bns)
+    blks = await rpc_batch(session, "eth_getBlockByNumber", bns, lambda bn: [hex(bn), True])
+    if blks is None:
+        # provider rejected the batch (e.g. batching unsupported): one request per block
+        return await asyncio.gather(*(fetch_block(session, bn) for bn in bns))
+    retry = [i for i, blk in enumerate(blks) if blk is None]
+    if retry:
+        for i, blk in zip(retry, await asyncio.gather(*(fetch_block(session, bns[i]) for i in retry))):
+            blks[i] = blk
+    return blks
+
+async def fetch_tx_counts(session, bns):
+    """Transaction count per block in bns (None where unknown, so the block is fetched in full),
+    as one cheap JSON-RPC batch."""
+    bns = list(bns)
+    counts = await rpc_batch(session, "eth_getBlockTransactionCountByNumber", bns, lambda bn: [hex(bn)])
+    if counts is None:
+        return [None] * len(bns)
+    return [None if c is None else int(c, 16) for c in counts]
+
+def _band_indices(vals, lo, hi):
+    """Indices i with lo <= vals[i] <= hi (uint64 array and bounds)."""
+    out = np.empty(vals.shape[0], np.int64)
+    n = 0
+    for i in range(vals.shape[0]):
+        v = vals[i]
+        if lo <= v and v <= hi:
+            out[n] = i
+            n += 1
+    return out[:n]
+
+if njit is not None:
+    band_indices = njit(cache=True)(_band_indices)
+    band_indices(np.zeros(1, np.uint64), np.uint64(0), np.uint64(0))  # compile at import, not mid-scan
+else:
+    def band_indices(vals, lo, hi):
+        return np.flatnonzero((vals >= lo) & (vals <= hi))
 
 def ensure_output():
     RESULTS_DIR.mkdir(parents=True, exist_ok=True)
     write_header = not OUT_FILE.exists()
-    f = open(OUT_FILE, "a", newline="")
-    writer = csv.writer(f)
+    f = open(OUT_FILE, "ab")
     if write_header:
-        writer.writerow(["block", "tx_hash", "value_eth", "from", "to"])
+        f.write(b"block,tx_hash,value_eth,from,to\r\n")
         f.flush()
-    return f, writer
+    return f
 
-async def process_block(session, bn: int, writer, seen: set):
-    blk = await fetch_block(session, bn)
+def csv_line(row) -> bytes:
+    """One output row exactly as csv.writer wrote it (str() fields, CRLF). Every field is an
+    int, a float or a 0x-hex string, so nothing ever needs quoting."""
+    bn, txh, eth, frm, to = row
+    return f"{bn},{txh},{eth},{frm or ''},{to}\r\n".encode()
+
+def process_block(blk, bn: int, seen: set) -> list:
+    """CSV rows for the new dust txs in one block; seen holds 64-bit keys of earlier hits."""
     if not blk or "transactions" not in blk:
-        return 0
-    found = 0
-    for tx in blk["transactions"]:
+        return []
+    txs = blk["transactions"]
+    n = len(txs)
+    try:
+        vals = np.fromiter((min(int(tx.get("value") or "0x0", 16), U64_MAX) for tx in txs),
+                           dtype=np.uint64, count=n)
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ block {bn}: malformed tx value ({e}); block skipped")
+        return []
+    rows = []
+    rows_append, seen_add = rows.append, seen.add
+    for i in band_indices(vals, np.uint64(WEI_MIN), np.uint64(WEI_MAX)).tolist():
+        tx = txs[i]
         to_ = tx.get("to")
-        val = tx.get("value")
-        if not to_ or not val:
+        # contract creations (no "to") and txs without a value are never dust hits
+        if not (to_ and tx.get("value")):
             continue
-        try:
-            eth_val = float(Web3.from_wei(int(val, 16), "ether"))
-        except Exception:
-            continue
-        if DUST_MIN <= eth_val <= DUST_MAX:
-            txh = tx.get("hash")
-            if txh not in seen:
-                seen.add(txh)
-                writer.writerow([bn, txh, eth_val, tx.get("from"), to_])
-                found += 1
-    return found
+        txh = tx["hash"]
+        key = int(txh[2:18], 16)  # 64-bit dedup key: leading 8 bytes of the (uniformly random) tx hash
+        if key not in seen:
+            seen_add(key)
+            rows_append((bn, txh, int(vals[i]) / 10**18, tx.get("from"), to_))
+    return rows
 
 def fmt_eta(seconds: float) -> str:
     if seconds < 0: seconds = 0
@@ -87,78 +211,127 @@ def fmt_eta(seconds: float) -> str:
     if m: return f"{m}m {s}s"
     return f"{s}s"
 
-async def scan_range(start_bn: int, end_bn: int):
+async def scan_range(session, start_bn: int, end_bn: int, seen: set):
     total_blocks = max(0, end_bn - start_bn + 1)
-    batches_total = math.ceil(total_blocks / BATCH) if total_blocks else 0
-    batch_index = 0
-
-    f, writer = ensure_output()
-    seen = set()
-    total_found = 0
-    t0 = time.time()
-
-    async with aiohttp.ClientSession() as session:
-        for batch_start in range(start_bn, end_bn + 1, BATCH):
-            batch_end = min(batch_start + BATCH - 1, end_bn)
-            t_batch = time.time()
-            tasks = [process_block(session, bn, writer, seen) for bn in range(batch_start, batch_end + 1)]
-            results = await asyncio.gather(*tasks)
-            batch_found = sum(results)
-            total_found += batch_found
-
-            # flush + save state
-            f.flush()
-            write_last_block(batch_end)
-
-            # progress metrics
-            batch_index += 1
-            done_blocks = min(total_blocks, batch_index * BATCH)
-            progress = (done_blocks / total_blocks) * 100 if total_blocks else 100.0
-            elapsed = time.time() - t0
-            avg_per_batch = elapsed / batch_index
-            eta = avg_per_batch * (batches_total - batch_index) if batches_total else 0
-
-            # log every LOG_EVERY batches (and first/last)
-            if batch_index == 1 or batch_index % LOG_EVERY == 0 or done_blocks >= total_blocks:
-                print(
-                    f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] "
-                    f"Blocks {batch_start}-{batch_end} | found {batch_found} | "
-                    f"progress {progress:.1f}% ({done_blocks}/{total_blocks}) | "
-                    f"elapsed {fmt_eta(elapsed)} | ETA {fmt_eta(eta)} | "
-                    f"saved last_block={batch_end}",
-                    flush=True
-                )
-
-    f.close()
+    work_q = asyncio.Queue()      # (first, last) block of each RPC batch still to fetch
+    for lo in range(start_bn, end_bn + 1, RPC_BATCH):
+        work_q.put_nowait((lo, min(lo + RPC_BATCH - 1, end_bn)))
+    results_q = asyncio.Queue()   # (first, last, rows, empty blocks skipped) per fetched + parsed RPC batch
+
+    async def producer():
+        # WORKERS of these keep that many RPC batches in flight
+        while True:
+            try:
+                lo, hi = work_q.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            bns = range(lo, hi + 1)
+            if PROBE_EMPTY:
+                # full tx lists only for blocks that have transactions
+                counts = await fetch_tx_counts(session, bns)
+                bns = [bn for bn, c in zip(bns, counts) if c != 0]
+            blks = await fetch_blocks(session, bns) if bns else []
+            rows = [r for bn, blk in zip(bns, blks) for r in process_block(blk, bn, seen)]
+            await results_q.put((lo, hi, rows, hi - lo + 1 - len(bns)))
+
+    async def consumer():
+        # Sole owner of the CSV and state file. Batches can finish out of order, so they wait
+        # in a min-heap and are written in block order: last_block never skips a gap.
+        f = ensure_output()
+        pending = []
+        next_bn = start_bn
+        total_found = found_since_log = empty_since_log = 0
+        done_batches = 0
+        logged_at = None  # done_batches at the last progress line
+        log_from = start_bn
+        t0 = time.time()
+        try:
+            while next_bn <= end_bn:
+                heapq.heappush(pending, await results_q.get())
+                saved = None
+                while pending and pending[0][0] == next_bn:
+                    lo, hi, rows, empty = heapq.heappop(pending)
+                    empty_since_log += empty
+                    f.write(b"".join(map(csv_line, rows)))
+                    total_found += len(rows)
+                    found_since_log += len(rows)
+                    done_batches += 1
+                    next_bn, saved = hi + 1, hi
+                if saved is None:
+                    continue
+
+                # rows hit the file before the state can claim their blocks
+                f.flush()
+                note_last_block(saved)
+
+                # save state + log about every LOG_EVERY * WORKERS RPC batches (and first/last)
+                if logged_at is None or done_batches - logged_at >= LOG_EVERY * WORKERS or next_bn > end_bn:
+                    flush_last_block()
+                    done_blocks = next_bn - start_bn
+                    progress = (done_blocks / total_blocks) * 100 if total_blocks else 100.0
+                    elapsed = time.time() - t0
+                    eta = elapsed / done_blocks * (total_blocks - done_blocks)
+                    print(
+                        f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] "
+                        f"Blocks {log_from}-{saved} | found {found_since_log} | "
+                        + (f"empty {empty_since_log} | " if PROBE_EMPTY else "") +
+                        f"progress {progress:.1f}% ({done_blocks}/{total_blocks}) | "
+                        f"elapsed {fmt_eta(elapsed)} | ETA {fmt_eta(eta)} | "
+                        f"saved last_block={saved}",
+                        flush=True
+                    )
+                    logged_at, log_from, found_since_log, empty_since_log = done_batches, next_bn, 0, 0
+        finally:
+            f.close()
+        return total_found
+
+    tasks = [asyncio.create_task(consumer())]
+    tasks += [asyncio.create_task(producer()) for _ in range(max(1, WORKERS))]
+    try:
+        total_found, *_ = await asyncio.gather(*tasks)
+    finally:
+        # a failed fetch must not leave the consumer waiting forever
+        for t in tasks:
+            t.cancel()
     return total_found
 
-async def follow_tip(start_bn: int):
+async def follow_tip(session, start_bn: int, seen: set):
     current = start_bn
+    last_head = None
+    delay = FOLLOW_MIN_SLEEP
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 📡 Follow mode ON — tailing new blocks...")
     while True:
         try:
-            head = w3.eth.block_number
+            head = await fetch_head(session)
             if head >= current:
-                await scan_range(current, head)
+                await scan_range(session, current, head, seen)
                 current = head + 1
+            # poll fast right after a new block, back off while the head is unchanged
+            delay = FOLLOW_MIN_SLEEP if head != last_head else min(delay * 2, FOLLOW_MAX_SLEEP)
+            last_head = head
         except Exception as e:
             print(f"⚠️ follow_tip error: {e}")
-        await asyncio.sleep(5)
+            delay = FOLLOW_MAX_SLEEP
+        await asyncio.sleep(delay)
 
 async def main():
     head = w3.eth.block_number
     start_bn = read_last_block()
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 🚀 Dust sniper (stateful, verbose)")
     print(f"  RPC={RPC_URL}")
-    print(f"  Start {start_bn} → Head {head} (about {max(0, head-start_bn)} blocks) | batch={BATCH}, workers={WORKERS}")
+    print(f"  Start {start_bn} → Head {head} (about {max(0, head-start_bn)} blocks) | workers={WORKERS}, rpc_batch={RPC_BATCH}, probe_empty={int(PROBE_EMPTY)}")
     print(f"  Dust band: {DUST_MIN}–{DUST_MAX} ETH")
     print(f"  Output: {OUT_FILE}")
     print(f"  State file: {STATE_FILE}")
-    if FOLLOW:
-        await follow_tip(start_bn)
-    else:
-        total = await scan_range(start_bn, head)
-        print(f"✅ Finished. Found {total} dust txs. Updated {STATE_FILE} and appended to {OUT_FILE}")
+    # One session for the whole run so keep-alive connections survive across batches and follow polls
+    connector = aiohttp.TCPConnector(limit=max(WORKERS * 2, 16), ttl_dns_cache=300, keepalive_timeout=75)
+    seen = set()  # 64-bit keys of hit tx hashes, kept across follow passes
+    async with aiohttp.ClientSession(connector=connector, json_serialize=json_dumps) as session:
+        if FOLLOW:
+            await follow_tip(session, start_bn, seen)
+        else:
+            total = await scan_range(session, start_bn, head, seen)
+            print(f"✅ Finished. Found {total} dust txs. Updated {STATE_FILE} and appended to {OUT_FILE}")
 
 if __name__ == "__main__":
     asyncio.run(main())
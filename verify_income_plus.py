@@ -2,35 +2,106 @@ import os
 import sys
 import csv
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any, List
 
 import requests
-import pandas as pd
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from web3 import Web3
 
 SEND_LOG = "results/send_attempts_log.csv"
 OUT_LOG = "results/income_log.csv"
+TOKEN_META_CACHE_FILE = os.getenv("TOKEN_META_CACHE", "results/token_meta_cache.json")
 
-TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+# raw 32 bytes; log topics are HexBytes (a bytes subclass), so matching is a plain bytes compare
+TRANSFER_TOPIC = bytes(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+# Multicall3 (same address on mainnet and most EVM chains); aggregate3 lets single calls fail
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [{
+    "name": "aggregate3", "type": "function", "stateMutability": "payable",
+    "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+        {"name": "target", "type": "address"},
+        {"name": "allowFailure", "type": "bool"},
+        {"name": "callData", "type": "bytes"},
+    ]}],
+    "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+        {"name": "success", "type": "bool"},
+        {"name": "returnData", "type": "bytes"},
+    ]}],
+}]
+# (meta key, return type, calldata) for each ERC-20 metadata getter
+TOKEN_META_FIELDS = [(key, typ, Web3.keccak(text=f"{key}()")[:4])
+                     for key, typ in (("symbol", "string"), ("decimals", "uint8"), ("name", "string"))]
+# checksum token address -> meta dict; persisted to TOKEN_META_CACHE_FILE between runs.
+# Only tokens whose decimals() actually decoded go in: a fail-safe default of 18 must never stick.
+TOKEN_META_CACHE: Dict[str, Dict[str, Any]] = {}
+
+def load_token_meta_cache(path: str) -> None:
+    try:
+        TOKEN_META_CACHE.update(json.loads(Path(path).read_text()))
+    except (OSError, ValueError):
+        pass
+
+def save_token_meta_cache(path: str) -> None:
+    # write-then-rename so an interrupted run never leaves a truncated cache
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    tmp.write_text(json.dumps(TOKEN_META_CACHE))
+    tmp.replace(p)
+
+# Etherscan: pooled keep-alive connections, retries (and Retry-After) handled by urllib3
+etherscan_session = requests.Session()
+etherscan_session.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+    ),
+))
 
 def ts():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
+def iter_lines_reversed(f, chunk_size: int = 64 * 1024):
+    """Lines of a binary file from last to first, reading 64 KB blocks from the end."""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    tail = b""
+    while pos > 0:
+        step = min(chunk_size, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + tail).split(b"\n")
+        tail = lines.pop(0)  # may continue in the previous block
+        yield from reversed(lines)
+    yield tail
+
 def read_latest_txhash(path: str) -> Optional[str]:
+    # The send log is append-only, so the newest tx hash is the last non-empty one
     p = Path(path)
     if not p.exists():
         return None
     try:
-        df = pd.read_csv(p)
-        if "tx_hash" in df.columns and not df["tx_hash"].isna().all():
-            df = df.dropna(subset=["tx_hash"])
-            if "timestamp" in df.columns:
-                df = df.sort_values("timestamp", ascending=False)
-            return str(df.iloc[0]["tx_hash"]).strip()
+        with open(p, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]), [])
+            if "tx_hash" not in header:
+                return None
+            col = header.index("tx_hash")
+            for line in iter_lines_reversed(f):
+                row = next(csv.reader([line.decode("utf-8")]), [])
+                if row == header:
+                    break
+                if len(row) > col and row[col].strip():
+                    return row[col].strip()
     except Exception:
         return None
     return None
@@ -43,45 +114,80 @@ def etherscan_internal_by_txhash(api_key: str, txhash: str) -> Dict[str, Any]:
         "txhash": txhash,
         "apikey": api_key,
     }
-    for attempt in range(3):
-        try:
-            r = requests.get(url, params=params, timeout=20)
-            r.raise_for_status()
-            return r.json()
-        except Exception:
-            if attempt == 2:
-                raise
-            time.sleep(1.5)
-    return {"status":"0","message":"error","result":[]}
+    r = etherscan_session.get(url, params=params, timeout=20)
+    r.raise_for_status()
+    return r.json()
 
 def wei_to_eth(wei: str) -> float:
     try: return int(wei) / 1e18
     except Exception: return 0.0
 
 def decode_topic_address(topic_hex: str) -> str:
-    # last 20 bytes of the 32-byte topic
-    return Web3.to_checksum_address("0x" + topic_hex[-40:])
+    # last 20 bytes of the 32-byte topic, lower-case (checksum only where it is shown)
+    return "0x" + topic_hex[-40:].lower()
 
 def get_token_meta(w3: Web3, token_addr: str) -> Dict[str, Any]:
     # Try ERC-20 symbol() and decimals(). Fail-safe defaults.
+    token_addr = Web3.to_checksum_address(token_addr)
+    if token_addr in TOKEN_META_CACHE:
+        return TOKEN_META_CACHE[token_addr]
     abi = [
         {"name":"symbol","outputs":[{"type":"string"}],"inputs":[],"stateMutability":"view","type":"function"},
         {"name":"decimals","outputs":[{"type":"uint8"}],"inputs":[],"stateMutability":"view","type":"function"},
         {"name":"name","outputs":[{"type":"string"}],"inputs":[],"stateMutability":"view","type":"function"},
     ]
-    ct = w3.eth.contract(address=Web3.to_checksum_address(token_addr), abi=abi)
+    ct = w3.eth.contract(address=token_addr, abi=abi)
     meta = {"symbol":"", "decimals":18, "name":""}
+    decoded = False
     for f, key in [(ct.functions.symbol, "symbol"), (ct.functions.decimals, "decimals"), (ct.functions.name, "name")]:
         try:
             v = f().call()
             meta[key] = v
+            decoded |= key == "decimals"
         except Exception:
             pass
     # sanitize
     try: meta["decimals"] = int(meta.get("decimals", 18))
-    except Exception: meta["decimals"] = 18
+    except Exception: meta["decimals"], decoded = 18, False
+    if decoded:
+        TOKEN_META_CACHE[token_addr] = meta
     return meta
 
+def get_token_metas(w3: Web3, token_addrs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """get_token_meta for several tokens, uncached ones fetched in a single Multicall3 eth_call."""
+    tokens = list(dict.fromkeys(Web3.to_checksum_address(a) for a in token_addrs))
+    metas = {t: TOKEN_META_CACHE[t] for t in tokens if t in TOKEN_META_CACHE}
+    missing = [t for t in tokens if t not in metas]
+    if missing:
+        calls = [(t, True, data) for t in missing for _, _, data in TOKEN_META_FIELDS]
+        try:
+            mc = w3.eth.contract(address=MULTICALL3, abi=MULTICALL3_ABI)
+            results = mc.functions.aggregate3(calls).call()
+        except Exception:
+            results = None  # no Multicall3 on this chain/RPC: one call per getter
+        if results is None:
+            for t in missing:
+                metas[t] = get_token_meta(w3, t)
+        else:
+            n = len(TOKEN_META_FIELDS)
+            for i, t in enumerate(missing):
+                meta = {"symbol":"", "decimals":18, "name":""}
+                decoded = False
+                for (key, typ, _), (ok, ret) in zip(TOKEN_META_FIELDS, results[i * n:(i + 1) * n]):
+                    if not ok:
+                        continue
+                    try:
+                        meta[key] = w3.codec.decode([typ], ret)[0]
+                        decoded |= key == "decimals"
+                    except Exception:
+                        pass
+                try: meta["decimals"] = int(meta.get("decimals", 18))
+                except Exception: meta["decimals"], decoded = 18, False
+                metas[t] = meta
+                if decoded:
+                    TOKEN_META_CACHE[t] = meta
+    return metas
+
 def human_amount(value_raw: int, decimals: int) -> float:
     try:
         return float(value_raw) / (10 ** decimals)
@@ -97,33 +203,24 @@ def verify_income(txhash: str, to_addr: str, api_key: Optional[str], rpc_url: st
     }
     to_addr_lc = to_addr.lower()
 
-    # 1) ETH internal transfers via Etherscan (if API key is present)
-    if api_key:
-        try:
-            data = etherscan_internal_by_txhash(api_key, txhash)
-            if data.get("status") == "1":
-                for itx in data.get("result", []):
-                    if str(itx.get("to","")).lower() == to_addr_lc:
-                        out["eth_received"] += wei_to_eth(itx.get("value","0"))
-            else:
-                out["notes"].append(f"etherscan_internal_status={data.get('status')} msg={data.get('message')}")
-        except Exception as e:
-            out["notes"].append(f"etherscan_error:{e.__class__.__name__}")
+    # The Etherscan lookup and the receipt RPC are independent: run them side by side
+    pool = ThreadPoolExecutor(max_workers=1)
+    internal = pool.submit(etherscan_internal_by_txhash, api_key, txhash) if api_key else None
 
     # 2) ERC-20 transfers via receipt logs (RPC)
     w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": 30}))
     rcpt = w3.eth.get_transaction_receipt(txhash)
     # Iterate logs for Transfer events
+    hits = []  # (token address, raw value) for transfers to us
     for lg in rcpt.logs:
         if not lg["topics"]: 
             continue
-        if lg["topics"][0].hex() != TRANSFER_TOPIC:
+        if lg["topics"][0] != TRANSFER_TOPIC:
             continue
         # topics: [event, from, to]; data = value
         try:
             to_topic = lg["topics"][2].hex()
-            to_decoded = decode_topic_address(to_topic)
-            if to_decoded.lower() != to_addr_lc:
+            if decode_topic_address(to_topic) != to_addr_lc:
                 continue
         except Exception:
             continue
@@ -133,7 +230,12 @@ def verify_income(txhash: str, to_addr: str, api_key: Optional[str], rpc_url: st
             raw_val = int(lg["data"], 16)
         except Exception:
             raw_val = 0
-        meta = get_token_meta(w3, token_addr)
+        hits.append((token_addr, raw_val))
+
+    # Metadata for all tokens at once
+    metas = get_token_metas(w3, [t for t, _ in hits])
+    for token_addr, raw_val in hits:
+        meta = metas[Web3.to_checksum_address(token_addr)]
         amt = human_amount(raw_val, meta["decimals"])
         out["token_transfers_in"].append({
             "token": token_addr,
@@ -144,6 +246,20 @@ def verify_income(txhash: str, to_addr: str, api_key: Optional[str], rpc_url: st
             "amount": amt
         })
 
+    # 1) ETH internal transfers via Etherscan (if API key is present)
+    if internal is not None:
+        try:
+            data = internal.result()
+            if data.get("status") == "1":
+                for itx in data.get("result", []):
+                    if str(itx.get("to","")).lower() == to_addr_lc:
+                        out["eth_received"] += wei_to_eth(itx.get("value","0"))
+            else:
+                out["notes"].append(f"etherscan_internal_status={data.get('status')} msg={data.get('message')}")
+        except Exception as e:
+            out["notes"].append(f"etherscan_error:{e.__class__.__name__}")
+    pool.shutdown()
+
     return out
 
 def main():
@@ -162,7 +278,11 @@ def main():
         sys.exit("❌ No tx hash provided and none found in send_attempts_log.csv")
 
     print(f"🔎 Verifying income for tx: {txhash}")
+    load_token_meta_cache(TOKEN_META_CACHE_FILE)
+    known = len(TOKEN_META_CACHE)
     res = verify_income(txhash, to_addr, api_key, rpc)
+    if len(TOKEN_META_CACHE) != known:
+        save_token_meta_cache(TOKEN_META_CACHE_FILE)
 
     # Console summary
     if res["eth_received"] > 0: